@@ -3,7 +3,7 @@
 """
 #############################################################################################################
 Created on Thu May 07 2020
-Last edited on Mon Jun 15 2020
+Last edited on Sun Oct 18 2026
 
 Author: Sebastian Buchelt
 
@@ -34,19 +34,22 @@ Author: Sebastian Buchelt
 import argparse
 import procedures.georef_procedure as georef
 
-# create parser  with needed and optional input variables
-parser = argparse.ArgumentParser(description='Script to georeference webcam images')
-parser.add_argument(dest='in_dir', type=str, help='directory containing input')
-parser.add_argument(dest='out_dir', type=str, help='output directory')
-parser.add_argument("-n", "--name_of_run", type = str, help='naming of PRACTISE run', default='test_run')
-parser.add_argument("-no_view","--no_view", help="add, if intermediate projection result should not be shown in Octave", action="store_true")
-parser.add_argument("-gcp","--gcp_correction", help="add, if interactive gcp correction is executed (only needed in Windows)", action="store_true")
-parser.add_argument("-r","--results", help="add, if only results of a specific run should be calculated", action="store_true")
-args = parser.parse_args()
-if args.no_view:
-    view = False
-else:
-    view = True
+# run script only, if it is executed directly (worker processes of multiprocessing re-import this module)
+if __name__ == '__main__':
+
+    # create parser  with needed and optional input variables
+    parser = argparse.ArgumentParser(description='Script to georeference webcam images')
+    parser.add_argument(dest='in_dir', type=str, help='directory containing input')
+    parser.add_argument(dest='out_dir', type=str, help='output directory')
+    parser.add_argument("-n", "--name_of_run", type = str, help='naming of PRACTISE run', default='test_run')
+    parser.add_argument("-no_view","--no_view", help="add, if intermediate projection result should not be shown in Octave", action="store_true")
+    parser.add_argument("-gcp","--gcp_correction", help="add, if interactive gcp correction is executed (only needed in Windows)", action="store_true")
+    parser.add_argument("-r","--results", help="add, if only results of a specific run should be calculated", action="store_true")
+    args = parser.parse_args()
+    if args.no_view:
+        view = False
+    else:
+        view = True
     
-# pass arguments to georef procedure
-georef.georef_webcam(args.in_dir,args.out_dir, args.name_of_run, view, args.gcp_correction, args.results)
+    # pass arguments to georef procedure
+    georef.georef_webcam(args.in_dir,args.out_dir, args.name_of_run, view, args.gcp_correction, args.results)
@@ -4,7 +4,7 @@
 """
 #############################################################################################################
 Created on Wed May 6 2020
-Last edited on Tue Jun 16 2020
+Last edited on Sun Oct 18 2026
 
 Author: Sebastian Buchelt
 
@@ -35,6 +35,10 @@ Author: Sebastian Buchelt
 %                       in given directories and all subdirectories. Returns  
 %                       the filename, if only one exists, or gives option to  
 %                       select one filename from list.
+%               geotiff_options: creates GTiff creation options for tiled &
+%                       compressed output
+%               convert_to_cog: converts tif-file to Cloud-Optimized GeoTIFF
+%                       with overviews
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
 #############################################################################################################
@@ -177,4 +181,55 @@ def select_file(in_dir, extension, sub_dir = False, name = 'DEM'):
     
     # return selected or detected file to main procedure
     return selected_file
-#############################################################################################################
\ No newline at end of file
+#############################################################################################################
+
+
+
+############### create creation options for tiled & compressed GTiff output #################################
+# input:
+#       - compress: compression of tif-file ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - predictor: predictor used for compression (2: integer data, 3: floating point data)
+#       - tiled: if True, tif-file is stored in tiles instead of stripes
+#       - blocksize: size of tiles in pixel
+def geotiff_options(compress = 'DEFLATE', predictor = None, tiled = True, blocksize = 256):
+    options = ['BIGTIFF=IF_SAFER']
+    if tiled:
+        options += ['TILED=YES', 'BLOCKXSIZE='+str(blocksize), 'BLOCKYSIZE='+str(blocksize)]
+    if compress and not compress.upper() == 'NONE':
+        options += ['COMPRESS='+compress.upper()]
+        if predictor:
+            options += ['PREDICTOR='+str(predictor)]
+    # return list of creation options to main procedure
+    return options
+#############################################################################################################
+
+
+
+############### convert tif-file to Cloud-Optimized GeoTIFF (COG) with overviews ############################
+# input:
+#       - tif_file: tif-file, which should be converted (is replaced by COG)
+#       - compress: compression of tif-file ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - predictor: predictor used for compression (2: integer data, 3: floating point data)
+#       - resampling: resampling method used to calculate overviews
+def convert_to_cog(tif_file, compress = 'DEFLATE', predictor = None, resampling = 'AVERAGE'):
+    # import required libraries
+    import os, gdal
+
+    tmp_file = os.path.splitext(tif_file)[0]+'_cog_tmp.tif'
+    options = ['COMPRESS='+compress.upper()]
+    if predictor and not compress.upper() == 'NONE':
+        options += ['PREDICTOR='+str(predictor)]
+
+    ##### use COG driver (GDAL >= 3.1), which calculates overviews itself
+    if gdal.GetDriverByName('COG') is not None:
+        gdal.Translate(tmp_file, tif_file, format = 'COG', creationOptions = options + ['OVERVIEWS=AUTO', 'RESAMPLING='+resampling, 'BIGTIFF=IF_SAFER'])
+    ##### otherwise calculate overviews & copy them in COG layout into tiled tif-file
+    else:
+        inDs = gdal.Open(tif_file, gdal.GA_Update)
+        factors = [2**i for i in range(1, 12) if min(inDs.RasterXSize, inDs.RasterYSize)/2**i >= 256]
+        if factors:
+            inDs.BuildOverviews(resampling, factors)
+        inDs = None
+        gdal.Translate(tmp_file, tif_file, format = 'GTiff', creationOptions = geotiff_options(compress, predictor, blocksize = 512) + ['COPY_SRC_OVERVIEWS=YES'])
+    os.replace(tmp_file, tif_file)
+#############################################################################################################
@@ -0,0 +1,1328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+#############################################################################################################
+Created on Sun Oct 18 2026
+Last edited on Sun Oct 18 2026
+
+Author: Sebastian Buchelt
+
+/******************************************************************************
+ *                                                                            *
+ *   This program is public software; It is distributed under the the terms   *
+ *   of the Creative Commons Attribution-NonCommercial-ShareAlike 4.0         *
+ *   International Public License as published by the Creative Commons        *
+ *   Corporation; either version 4 of the License, or (at your option) any    *
+ *   later version.                                                           *
+ *                                                                            *
+ ******************************************************************************/
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%   Name:       modules/aux_project2map.py
+%   Purpose:    Auxiliary Functions to project data with georef_webcam output
+%   Comment:    This file contains auxiliary functions used by the projection
+%               procedures in procedures/project2map.py.
+%
+%   Overview:   read_coordinate_rasters: reads mask and coordinate rasters
+%                       from coord_dir
+%               hash_coordinate_rasters: calculates hash of the coordinate
+%                       rasters & mask (used as key for cached results)
+%               calculate_lut: calculates lookup table, which assigns each
+%                       image pixel to a map pixel
+%               get_lut: loads lookup table from cache or calculates &
+%                       stores it next to the coordinate rasters
+%               projection_operator: creates sparse matrix, which projects
+%                       image pixels to map pixels (mean aggregation)
+%               get_coordinate_tree: builds KD-tree over map coordinates of
+%                       all valid image pixels
+%               calculate_pull_index: calculates for each map pixel the
+%                       nearest image pixels & their weights
+%               get_pull_operator: creates sparse matrix, which pulls image
+%                       values into each map pixel (cached)
+%               get_operator: creates projection matrix for selected
+%                       resampling mode
+%               mask_nodata: excludes no-Data pixels from band or stack
+%               project_stack: projects a single band or a stack of bands/
+%                       frames to map pixels with the projection operator
+%               aggregate_groups: aggregates image pixels assigned to each map
+%                       pixel with median, min, max, std or mode
+%               output_datatype: defines data type, no-Data-value & predictor
+%                       of projected output
+%               convert_datatype: converts projected values to output data
+%                       type
+%               create_mask_band: creates mask band for output without
+%                       no-Data-value
+%               write_mask: writes validity of output pixels into mask band
+%               fill_gaps: fills gaps in projected bands by interpolation
+%               project_file: projects all bands of a single tif-file to map
+%                       and stores the result as tif-file
+%               share_arrays: places arrays in shared memory
+%               attach_arrays: reads arrays from shared memory
+%               init_projection_worker: prepares worker process for parallel
+%                       projection
+%               run_projection_worker: projects a single file in worker
+%                       process
+%               project_files_parallel: projects list of tif-files on a
+%                       process pool
+%               footprint_window: calculates pixel window of a raster, which
+%                       covers the camera footprint
+%               sample_window: samples raster window at fractional pixel
+%                       positions (bilinear or cubic)
+%               calculate_image_index: calculates for all valid image pixels
+%                       the corresponding pixel in a geotif (image plane)
+%               get_image_index: loads image plane index from memory cache
+%                       or calculates it
+%               locate_in_image: finds image position (col, row) of map
+%                       coordinates (e.g. vertices of geometries)
+%               get_vertices: extracts all vertices of a geometry (incl.
+%                       multi-geometries & holes) as array
+%               set_vertices: writes array of vertices back to geometry
+%               interpolate_coordinates: interpolates map coordinates at
+%                       fractional image positions (bilinear)
+%               project_vertices: projects vertices from map to image plane
+%                       or from image plane to map
+%               write_feature_batch: projects geometries of a batch of
+%                       features & stores them in output layer
+%               calculate_footprint: derives polygon of camera footprint from
+%                       coordinate rasters & mask
+%               get_footprint: loads camera footprint from cache or
+%                       calculates & stores it next to the coordinate rasters
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+#############################################################################################################
+"""
+
+############### read mask and coordinate rasters from coord_dir #############################################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - input_list: list of rasters, which should be read
+def read_coordinate_rasters(coord_dir, input_list = ['mask.tif', 'north_raster.tif', 'east_raster.tif']):
+    # import required libraries
+    from osgeo.gdalconst import GA_ReadOnly
+    import os, gdal, sys
+    import numpy as np
+
+    ##### open & read coordinate raster and mask layers
+    driver = gdal.GetDriverByName('GTiff')
+    driver.Register()
+    rasters = dict()
+    for i in input_list:
+        datafile = os.path.join(coord_dir, i)
+        inDs = gdal.Open(datafile, GA_ReadOnly)
+        if inDs is None:
+            print ('could not open ' + datafile)
+            sys.exit(1)
+        rasters[i.split('.')[0]] = inDs.GetRasterBand(1).ReadAsArray().astype(np.float64)
+        inDs = None
+    # return dictionary with arrays (keys: 'mask', 'north_raster', 'east_raster') to main procedure
+    return rasters
+#############################################################################################################
+
+
+
+############### calculate hash of coordinate rasters & mask #################################################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - params: additional parameters, which should be part of the hash (e.g. pixel size)
+#       - input_list: list of rasters, which are included in the hash
+def hash_coordinate_rasters(coord_dir, params = (), input_list = ['mask.tif', 'north_raster.tif', 'east_raster.tif']):
+    # import required libraries
+    import os, hashlib
+
+    ##### hash file content of all rasters and the given parameters
+    hash_obj = hashlib.sha1()
+    for i in input_list:
+        with open(os.path.join(coord_dir, i), 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                hash_obj.update(chunk)
+    hash_obj.update(repr(tuple(params)).encode())
+    # return hash as hex-string to main procedure
+    return hash_obj.hexdigest()
+#############################################################################################################
+
+
+
+############### calculate lookup table between image pixels and map pixels ##################################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - px_size: spatial resolution of projected map
+def calculate_lut(coord_dir, px_size):
+    # import required libraries
+    import numpy as np
+
+    ##### read coordinate raster and mask layers
+    rasters = read_coordinate_rasters(coord_dir)
+    mask, north, east = rasters['mask'], rasters['north_raster'], rasters['east_raster']
+
+    ####################### derive extent of map array  #######################
+    ##### mask georeferencing layers
+    north[mask==0] = np.nan
+    east[mask==0] = np.nan
+
+    ##### get maximum spatial extent uf remaining image area in world coordinate system
+    min_max_east = (np.nanmin(east), np.nanmax(east))
+    min_max_north = (np.nanmin(north), np.nanmax(north))
+
+    ##### correct extent values, so that whole extent is covered & extent is divideable by pixel_size
+    half_px = px_size/2
+    min_max_east = (round(min_max_east[0]/px_size)*px_size-half_px, round(min_max_east[1]/px_size)*px_size+half_px)
+    min_max_north = (round(min_max_north[0]/px_size)*px_size-half_px, round(min_max_north[1]/px_size)*px_size+half_px)
+
+    ##### get number of rows & cols of projected map
+    row_number = int((min_max_north[1]-min_max_north[0])/px_size)
+    col_number = int((min_max_east[1]-min_max_east[0])/px_size)
+
+    ################ calculate for each image pixel the #######################
+    ############## correlating position in the new array ######################
+    ##### select all image pixels with valid coordinates (flat index in image array)
+    img_px = np.flatnonzero(~(np.isnan(east) | np.isnan(north)))
+    ##### get easting & northing position in map array for all of them at once
+    east_pos = ((east.ravel()[img_px]-min_max_east[0])/px_size).astype(np.int64)
+    north_pos = ((north.ravel()[img_px]-min_max_north[0])/px_size).astype(np.int64)+1
+    # only keep pixels, which are located within the map extent
+    inside = (east_pos>=0) & (east_pos<col_number) & (north_pos>0) & (north_pos<=row_number)
+    img_px = img_px[inside]
+    ##### flat index of the correlating pixel in map array
+    map_px = (row_number-north_pos[inside])*col_number+east_pos[inside]
+
+    ##### collect lookup table
+    lut = {'img_px': img_px,                                                            # flat index in image array
+           'map_px': map_px,                                                            # flat index in map array
+           'img_shape': np.array(mask.shape),                                          # rows & cols of image
+           'map_shape': np.array((row_number, col_number)),                            # rows & cols of map
+           'geotransform': np.array((min_max_east[0], px_size, 0, min_max_north[1], 0, -px_size))}  # geotransformation of map
+    # return lookup table to main procedure
+    return lut
+#############################################################################################################
+
+
+
+############### load lookup table from cache or calculate and cache it ######################################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - px_size: spatial resolution of projected map
+def get_lut(coord_dir, px_size):
+    # import required libraries
+    import os, tempfile
+    import numpy as np
+
+    ##### lookup table is stored next to coordinate rasters,
+    # key of the file is the hash of the rasters and the pixel size
+    lut_file = os.path.join(coord_dir, 'lut_'+hash_coordinate_rasters(coord_dir, (float(px_size),))+'.npz')
+    if os.path.isfile(lut_file):
+        with np.load(lut_file) as cached:
+            lut = {key: cached[key] for key in cached.files}
+        return lut
+
+    ##### calculate lookup table once & store it for all later runs
+    # (written to temporary file first, so that parallel runs never read incomplete files)
+    print('Calculate lookup table for pixel size ' + str(px_size) + '...')
+    lut = calculate_lut(coord_dir, px_size)
+    fd, tmp_file = tempfile.mkstemp(suffix='.npz', dir=coord_dir)
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **lut)
+    os.replace(tmp_file, lut_file)
+    # return lookup table to main procedure
+    return lut
+#############################################################################################################
+
+
+
+############### create sparse matrix to project image pixels to map pixels ##################################
+# input:
+#       - lut: lookup table between image and map pixels (see get_lut)
+def projection_operator(lut):
+    # import required libraries
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    ##### each row of the matrix is a map pixel, each column an image pixel
+    # entries are 1, if the image pixel is assigned to the map pixel
+    n_map = int(np.prod(lut['map_shape']))
+    n_img = int(np.prod(lut['img_shape']))
+    operator = csr_matrix((np.ones(len(lut['img_px'])), (lut['map_px'], lut['img_px'])), shape=(n_map, n_img))
+    # return sparse matrix to main procedure
+    return operator
+#############################################################################################################
+
+
+
+############### build KD-tree over map coordinates of all valid image pixels ################################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - use_mask: if True, only image pixels inside the mask are used; otherwise all pixels with valid coordinates
+# tree is kept in memory for all later calls with the same coordinate rasters
+tree_cache = dict()
+def get_coordinate_tree(coord_dir, use_mask = True):
+    # import required libraries
+    import numpy as np
+    from scipy.spatial import cKDTree
+
+    key = (hash_coordinate_rasters(coord_dir), use_mask)
+    if key not in tree_cache:
+        ##### select all image pixels with valid coordinates (flat index in image array)
+        rasters = read_coordinate_rasters(coord_dir)
+        east, north = rasters['east_raster'].ravel(), rasters['north_raster'].ravel()
+        img_px = np.flatnonzero(~(np.isnan(east) | np.isnan(north)))
+        if use_mask:
+            img_px = img_px[~(rasters['mask'].ravel()[img_px]==0)]
+        ##### build tree over (easting, northing) of these pixels
+        tree_cache[key] = (cKDTree(np.column_stack((east[img_px], north[img_px]))), img_px)
+    # return KD-tree and flat image index of each tree point to main procedure
+    return tree_cache[key]
+#############################################################################################################
+
+
+
+############### calculate nearest image pixels & weights for each map pixel (inverse/pull resampling) #######
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - lut: lookup table between image and map pixels (only map_shape & geotransform are needed)
+#       - k: number of nearest image pixels used for each map pixel (1: nearest neighbour; >1: inverse distance weighting)
+#       - max_radius: maximum distance (in map units) between map pixel center and image pixel
+#       - power: power of inverse distance weighting
+#       - block_pixels: approximate number of map pixels, which are queried at once
+# only found neighbours are kept (compressed sparse rows: weights, image pixels & start of each map pixel)
+def calculate_pull_index(coord_dir, lut, k = 1, max_radius = None, power = 2, block_pixels = 2**20):
+    # import required libraries
+    import numpy as np
+
+    ##### get KD-tree over valid image pixels
+    tree, img_px = get_coordinate_tree(coord_dir)
+
+    ##### coordinates of map pixel centers
+    row_number, col_number = [int(x) for x in lut['map_shape']]
+    gt = lut['geotransform']
+    map_east = gt[0] + (np.arange(col_number)+0.5)*gt[1]
+    map_north = gt[3] + (np.arange(row_number)+0.5)*gt[5]
+    if max_radius is None:
+        max_radius = np.inf
+
+    ##### query nearest image pixels within maximum radius block by block (missing neighbours are dropped)
+    data, indices, counts = list(), list(), list()
+    block_rows = max(1, block_pixels//col_number)
+    for row_start in range(0, row_number, block_rows):
+        row_end = min(row_start+block_rows, row_number)
+        centers = np.column_stack((np.tile(map_east, row_end-row_start), np.repeat(map_north[row_start:row_end], col_number)))
+        distance, index = tree.query(centers, k = k, distance_upper_bound = max_radius)
+        distance = distance.reshape((len(centers), k))
+        index = index.reshape((len(centers), k))
+        found = index < len(img_px)
+        ##### weights: 1 for nearest neighbour, inverse distance for k > 1
+        if k == 1:
+            data.append(np.ones(np.count_nonzero(found), dtype=np.float32))
+        else:
+            data.append((1/np.maximum(distance[found], 1e-6)**power).astype(np.float32))
+        indices.append(img_px[index[found]].astype(np.int32))
+        counts.append(np.count_nonzero(found, axis=1))
+        del centers, distance, index, found
+    indptr = np.concatenate(([0], np.cumsum(np.concatenate(counts)))).astype(np.int64)
+    # return weights, flat image index & start of each map pixel to main procedure
+    return np.concatenate(data), np.concatenate(indices), indptr
+#############################################################################################################
+
+
+
+############### create sparse matrix, which pulls image values into map pixels (cached) #####################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - lut: lookup table between image and map pixels (see get_lut)
+#       - k: number of nearest image pixels used for each map pixel (1: nearest neighbour; >1: inverse distance weighting)
+#       - max_radius: maximum distance (in map units) between map pixel center and image pixel
+def get_pull_operator(coord_dir, lut, k = 1, max_radius = None):
+    # import required libraries
+    import os, tempfile
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    ##### sparse index is stored compressed next to coordinate rasters (like the lookup table)
+    px_size = float(lut['geotransform'][1])
+    pull_file = os.path.join(coord_dir, 'pull_'+hash_coordinate_rasters(coord_dir, (px_size, int(k), max_radius, 'csr'))+'.npz')
+    if os.path.isfile(pull_file):
+        with np.load(pull_file) as cached:
+            data, indices, indptr = cached['data'], cached['indices'], cached['indptr']
+    else:
+        print('Calculate nearest image pixels for pixel size ' + str(px_size) + '...')
+        data, indices, indptr = calculate_pull_index(coord_dir, lut, k, max_radius)
+        fd, tmp_file = tempfile.mkstemp(suffix='.npz', dir=coord_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, data = data, indices = indices, indptr = indptr)
+        os.replace(tmp_file, pull_file)
+
+    ##### each row of the matrix is a map pixel, each column an image pixel; entries are the weights
+    n_img = int(np.prod(lut['img_shape']))
+    operator = csr_matrix((data, indices, indptr), shape=(len(indptr)-1, n_img))
+    # return sparse matrix to main procedure
+    return operator
+#############################################################################################################
+
+
+
+############### create projection matrix for selected resampling mode #######################################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - lut: lookup table between image and map pixels (see get_lut)
+#       - resampling: 'push': image pixels are assigned to the map pixel they fall in (forward projection)
+#                     'nearest': each map pixel gets the value of the nearest image pixel (inverse projection)
+#                     'idw': each map pixel gets the inverse distance weighted mean of the k nearest image pixels
+#       - k: number of nearest image pixels used with 'idw'
+#       - max_radius: maximum distance (in map units) between map pixel center and image pixel for 'nearest' & 'idw'
+#                     (default: 3 times the pixel size of the map)
+def get_operator(coord_dir, lut, resampling = 'push', k = 4, max_radius = None):
+    # import required libraries
+    import sys
+
+    if max_radius is None:
+        max_radius = 3*float(lut['geotransform'][1])
+
+    if resampling == 'push':
+        return projection_operator(lut)
+    elif resampling == 'nearest':
+        return get_pull_operator(coord_dir, lut, 1, max_radius)
+    elif resampling == 'idw':
+        return get_pull_operator(coord_dir, lut, k, max_radius)
+    print('Error: unknown resampling mode ' + str(resampling))
+    sys.exit(1)
+#############################################################################################################
+
+
+
+############### exclude no-Data pixels from band or stack of bands ###########################################
+# input:
+#       - stack: flattened image band (pixels) or stack of flattened bands/frames (pixels, N)
+#       - noDataVal: no-Data-value of input data (single value or one value per band/frame)
+# values are stored as float32 for data with up to 16 bit (float64 otherwise) & in C order for sparse matrix products
+# (stack is modified & used directly, if it already has this data type & order)
+def mask_nodata(stack, noDataVal = None):
+    # import required libraries
+    import numpy as np
+
+    values = np.ascontiguousarray(stack, dtype=np.result_type(stack.dtype, np.float32))
+    invalid = (values==noDataVal)
+    ##### no no-Data pixel: validity is not needed
+    if not invalid.any():
+        return values, None
+    ##### set no-Data pixels to 0 & mark them as invalid
+    values[invalid] = 0
+    # return values & validity (True: valid, False: no-Data; None: all valid) to main procedure
+    return values, ~invalid
+#############################################################################################################
+
+
+
+############### project band or stack of bands to map pixels (mean of all assigned image pixels) ############
+# input:
+#       - operator: sparse projection matrix (see projection_operator)
+#       - stack: flattened image band (pixels) or stack of flattened bands/frames (pixels, N)
+#       - noDataVal: no-Data-value of input data, these pixels are excluded
+#       - out_noData: no-Data-value assigned to map pixels without any image pixel
+#       - masked: tuple of values & validity (see mask_nodata); if given, stack & noDataVal are ignored
+def project_stack(operator, stack, noDataVal = None, out_noData = -9999, masked = None):
+    # import required libraries
+    import numpy as np
+
+    ##### exclude no-Data pixels from sum and count
+    if masked is None:
+        masked = mask_nodata(stack, noDataVal)
+    values, valid = masked
+
+    ##### sum up all values assigned to a map pixel & divide by their number to get the mean value
+    # number of image pixels assigned to each map pixel (without no-Data pixels: same number for all bands)
+    if valid is None:
+        count_array = operator.dot(np.ones(operator.shape[1]))
+        if values.ndim == 2:
+            count_array = np.broadcast_to(count_array[:,np.newaxis], (operator.shape[0], values.shape[1]))
+    else:
+        count_array = operator.dot(valid)
+    map_val = operator.dot(values)
+    map_val[count_array>0] = map_val[count_array>0]/count_array[count_array>0]
+    map_val[count_array==0] = out_noData                         # assign noData-value, if no value was assigned
+    # return projected values & number of assigned image pixels to main procedure
+    return map_val, count_array
+#############################################################################################################
+
+
+
+############### aggregate all image pixels assigned to a map pixel (median, min, max, std or mode) ##########
+# input:
+#       - operator: sparse projection matrix (see projection_operator), can be a block of map rows
+#       - masked: tuple of values & validity of image pixels (see mask_nodata)
+#       - method: aggregation method: 'median', 'min', 'max', 'std' (standard deviation) or 'mode' (majority)
+#       - out_noData: no-Data-value assigned to map pixels without any image pixel
+def aggregate_groups(operator, masked, method = 'median', out_noData = -9999):
+    # import required libraries
+    import sys
+    import numpy as np
+
+    ##### bring band or stack of bands to shape (pixels, N)
+    values, valid = masked
+    single_band = (values.ndim == 1)
+    values = values.reshape((values.shape[0], -1))
+    if valid is not None:
+        valid = valid.reshape((valid.shape[0], -1))
+
+    ##### map pixel of each entry of the projection matrix (entries are sorted by map pixel)
+    n_map = operator.shape[0]
+    group = np.repeat(np.arange(n_map), np.diff(operator.indptr))
+    map_val = np.full((n_map, values.shape[1]), out_noData, dtype=np.float64)
+    count_array = np.zeros((n_map, values.shape[1]))
+
+    ##### aggregate each band separately
+    for j in range(values.shape[1]):
+        # exclude no-Data pixels
+        ok = valid[operator.indices, j] if valid is not None else np.ones(len(operator.indices), dtype=bool)
+        g = group[ok]
+        v = values[operator.indices[ok], j]
+        if len(g) == 0:
+            continue
+        # get first entry & number of entries of each map pixel
+        starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+        n = np.diff(np.r_[starts, len(g)])
+        cells = g[starts]
+        count_array[cells, j] = n
+
+        ##### minimum & maximum
+        if method == 'min':
+            map_val[cells, j] = np.minimum.reduceat(v, starts)
+        elif method == 'max':
+            map_val[cells, j] = np.maximum.reduceat(v, starts)
+        ##### standard deviation (of all image pixels assigned to map pixel)
+        elif method == 'std':
+            dev = v - np.repeat(np.add.reduceat(v, starts)/n, n)
+            map_val[cells, j] = np.sqrt(np.add.reduceat(dev**2, starts)/n)
+        ##### median & mode require values sorted within each map pixel
+        else:
+            order = np.lexsort((v, g))
+            g = g[order]
+            v = v[order]
+            if method == 'median':
+                map_val[cells, j] = (v[starts+(n-1)//2] + v[starts+n//2])/2
+            elif method == 'mode':
+                # runs of equal values within each map pixel, most frequent value is selected
+                # (if several values are equally frequent, the smallest one is selected)
+                run_starts = np.flatnonzero(np.r_[True, (g[1:] != g[:-1]) | (v[1:] != v[:-1])])
+                run_len = np.diff(np.r_[run_starts, len(g)])
+                run_g = g[run_starts]
+                run_v = v[run_starts]
+                best = np.lexsort((run_v, -run_len, run_g))
+                best = best[np.r_[True, run_g[best][1:] != run_g[best][:-1]]]
+                map_val[run_g[best], j] = run_v[best]
+            else:
+                print('Error: unknown aggregation method ' + str(method))
+                sys.exit(1)
+
+    # return aggregated values & number of assigned image pixels to main procedure
+    if single_band:
+        return map_val[:,0], count_array[:,0]
+    return map_val, count_array
+#############################################################################################################
+
+
+
+############### define data type, no-Data-value & compression predictor of projected output #################
+# input:
+#       - src_type: GDAL data type of input data (e.g. gdal.GDT_Byte)
+#       - out_dtype: name of GDAL data type of output (e.g. 'Byte', 'UInt16', 'Float32'); if None, src_type is kept
+#       - noDataVal: no-Data-value of input data; used for output, if it fits into output data type
+# 8-bit output of input without no-Data-value gets no no-Data-value (None), no-Data is stored in mask band instead
+def output_datatype(src_type, out_dtype = None, noDataVal = None):
+    # import required libraries
+    import gdal, sys
+    from osgeo import gdal_array
+    import numpy as np
+
+    ##### get GDAL and numpy data type of output
+    if out_dtype:
+        gdal_type = gdal.GetDataTypeByName(out_dtype)
+        if gdal_type == gdal.GDT_Unknown:
+            print('Error: unknown data type ' + str(out_dtype))
+            sys.exit(1)
+    else:
+        gdal_type = src_type
+    np_dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(gdal_type))
+
+    ##### integer output: keep no-Data-value of input, if possible, otherwise use max (unsigned) or min (signed) value
+    if np.issubdtype(np_dtype, np.integer):
+        info = np.iinfo(np_dtype)
+        if noDataVal is not None and float(noDataVal).is_integer() and info.min <= noDataVal <= info.max:
+            out_noData = int(noDataVal)
+        ##### 8-bit output of input without no-Data-value (e.g. RGB images): all 256 values remain valid
+        elif noDataVal is None and np_dtype.itemsize == 1:
+            out_noData = None
+            print('Note: no-Data of ' + gdal.GetDataTypeName(gdal_type) + ' output is stored in mask band')
+        else:
+            out_noData = int(info.max) if info.min == 0 else int(info.min)
+            # (valid values equal to this value are clipped, see convert_datatype)
+            print('Note: no-Data-value of ' + gdal.GetDataTypeName(gdal_type) + ' output is set to ' + str(out_noData))
+        predictor = 2
+    ##### floating point output: no-Data-value -9999
+    else:
+        out_noData = -9999
+        predictor = 3
+    # return GDAL & numpy data type, no-Data-value and predictor to main procedure
+    return gdal_type, np_dtype, out_noData, predictor
+#############################################################################################################
+
+
+
+############### convert projected values to output data type ################################################
+# input:
+#       - map_val: projected values (float)
+#       - count_array: number of image pixels assigned to each map pixel (0: no-Data)
+#       - np_dtype: numpy data type of output
+#       - out_noData: no-Data-value of output (None: no-Data is stored in mask band, pixels are set to 0)
+#       - round_values: if True, mean values are rounded before they are converted to integers; otherwise truncated
+def convert_datatype(map_val, count_array, np_dtype, out_noData, round_values = True):
+    # import required libraries
+    import numpy as np
+
+    valid = (count_array>0) & ~np.isnan(map_val)
+    fill_value = 0 if out_noData is None else out_noData
+    ##### floating point data can be converted directly (pixels without valid value are set to no-Data)
+    if not np.issubdtype(np_dtype, np.integer):
+        values = np.array(map_val, dtype=np.float64)
+        values[~valid] = fill_value
+        return values.astype(np_dtype)
+
+    ##### integer data: round values & limit them to the value range of the data type
+    # (the no-Data-value is excluded from the value range)
+    info = np.iinfo(np_dtype)
+    low, high = info.min, info.max
+    if out_noData == high:
+        high -= 1
+    elif out_noData == low:
+        low += 1
+    values = np.rint(map_val) if round_values else np.trunc(map_val)
+    values = np.clip(np.where(valid, values, 0), low, high)
+    values[~valid] = fill_value
+    # return converted values to main procedure
+    return values.astype(np_dtype)
+#############################################################################################################
+
+
+
+############### create mask band for output without no-Data-value ##########################################
+# input:
+#       - dst_ds: GDAL dataset of output
+# one mask for all bands (0: no-Data, 255: valid), stored inside of tif-file
+def create_mask_band(dst_ds):
+    # import required libraries
+    import gdal
+
+    gdal.SetConfigOption('GDAL_TIFF_INTERNAL_MASK', 'YES')
+    dst_ds.CreateMaskBand(gdal.GMF_PER_DATASET)
+    gdal.SetConfigOption('GDAL_TIFF_INTERNAL_MASK', None)
+    # return mask band to main procedure
+    return dst_ds.GetRasterBand(1).GetMaskBand()
+#############################################################################################################
+
+
+
+############### write validity of output pixels into mask band ##############################################
+# input:
+#       - mask_band: mask band of output (see create_mask_band)
+#       - valid: validity of pixels, single band (pixels) or several bands (pixels, bands); 
+#                a pixel is valid, if it is valid in any band
+#       - shape: shape (rows, cols) of block
+#       - row_start: first row of block
+def write_mask(mask_band, valid, shape, row_start = 0):
+    # import required libraries
+    import numpy as np
+
+    if valid.ndim == 2:
+        valid = valid.any(axis=1)
+    mask_band.WriteArray(np.where(valid, 255, 0).astype(np.uint8).reshape(shape), 0, row_start)
+#############################################################################################################
+
+
+
+############### fill gaps in projected bands by interpolation (in parallel for all bands) ####################
+# input:
+#       - bands: list of GDAL bands (each band of its own dataset), in which no-Data pixels are filled
+#       - max_distance: maximum distance in pixels, within which values are searched for interpolation
+#       - valid: validity of pixels (rows, cols) of bands without no-Data-value (None: no-Data-value of bands is used)
+# returns validity after filling, if valid is given
+def fill_gaps(bands, max_distance, valid = None):
+    # import required libraries
+    from concurrent.futures import ThreadPoolExecutor
+    import gdal
+    import numpy as np
+
+    ##### bands without no-Data-value: pixels to fill are given by validity (one copy for each band)
+    # (additional band, in which valid pixels are 255, shows after filling, which pixels got a value)
+    masks = [None]*len(bands)
+    if valid is not None:
+        rows, cols = valid.shape
+        mask_ds = [gdal.GetDriverByName('MEM').Create('', cols, rows, 1, gdal.GDT_Byte) for i in range(len(bands)+2)]
+        for ds in mask_ds:
+            ds.GetRasterBand(1).WriteArray(np.where(valid, 255, 0).astype(np.uint8))
+        bands = list(bands) + [mask_ds[-1].GetRasterBand(1)]
+        masks = [ds.GetRasterBand(1) for ds in mask_ds[:-1]]
+
+    ##### fill each band with gdal.FillNodata on a thread pool & wait until all bands are finished
+    n = len(bands)
+    with ThreadPoolExecutor(max_workers = n) as pool:
+        list(pool.map(gdal.FillNodata, bands, masks, [float(max_distance)]*n, [0]*n))
+    # return validity after filling to main procedure
+    if valid is not None:
+        return bands[-1].ReadAsArray() > 0
+#############################################################################################################
+
+
+
+############### project all bands of a single tif-file to map & store result as tif-file ####################
+# input:
+#       - img_file: tif-file in image projection, which should be projected
+#       - operator: sparse projection matrix (see projection_operator)
+#       - lut: lookup table between image and map pixels (only map_shape & geotransform are needed)
+#       - pj_file: file which contains CRS information
+#       - out_dir: output directory where projected maps are stored
+#       - fill_nodata: if set, gaps in projected map are filled by interpolation within this pixel range
+#       - compress: compression of output tif-file ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - cog: if True, output is stored as Cloud-Optimized GeoTIFF with overviews
+#       - out_dtype: name of GDAL data type of output (e.g. 'Byte', 'Float32'); if None, data type of input is kept
+#       - round_values: if True, mean values are rounded for integer output; otherwise truncated
+#       - method: aggregation of image pixels assigned to a map pixel: 'mean', 'median', 'min', 'max', 'std' or 'mode'
+#       - count_band: if True, an additional band with the number of image pixels assigned to each map pixel is stored
+#       - block_pixels: approximate number of map pixels, which are projected & written at once
+def project_file(img_file, operator, lut, pj_file, out_dir, fill_nodata=False, compress='DEFLATE', cog=False, out_dtype=None, round_values=True, 
+                 method='mean', count_band=False, block_pixels=2**22):
+    # import required libraries
+    from osgeo.gdalconst import GA_ReadOnly
+    import os, gdal
+    import numpy as np
+    import modules.aux_functions as aux_func
+    row_number, col_number = [int(x) for x in lut['map_shape']]
+
+    ##### read all bands into a (pixels, bands) array & exclude no-Data pixels
+    inDs = gdal.Open(img_file, GA_ReadOnly)
+    no_of_bands = inDs.RasterCount
+    image = inDs.ReadAsArray().reshape((no_of_bands, -1)).T
+    # undefined no-Data-values are replaced by nan, so that no pixel is excluded
+    noDataVals = [inDs.GetRasterBand(i+1).GetNoDataValue() for i in range(no_of_bands)]
+    masked = mask_nodata(image, np.array([np.nan if val is None else val for val in noDataVals]))
+    del image
+    ##### keep data type of input or convert to selected output data type
+    gdal_type, np_dtype, out_noData, predictor = output_datatype(inDs.GetRasterBand(1).DataType, out_dtype, noDataVals[0])
+    inDs = None
+
+    ##### create tiled & compressed tif-file for projected result
+    img_name = os.path.basename(img_file)               # get image name
+    tif_name = img_name.split('.')[0]+'_map.tif'         # create output map name from that
+    # (optional: last band contains number of image pixels assigned to each map pixel of first band)
+    dst_ds = gdal.GetDriverByName('GTiff').Create(os.path.join(out_dir,tif_name), col_number, row_number, no_of_bands+int(count_band), gdal_type, 
+                                                  options = aux_func.geotiff_options(compress, predictor))
+    # define no-Data-value (or mask band, if output has no no-Data-value)
+    mask_band = create_mask_band(dst_ds) if out_noData is None else None
+    if mask_band is None:
+        for i in range(no_of_bands):
+            dst_ds.GetRasterBand(i+1).SetNoDataValue(out_noData)
+    if count_band:
+        dst_ds.GetRasterBand(no_of_bands+1).SetDescription('count')
+        # number of pixels is limited to value range of data type (without no-Data-value)
+        count_max = np.inf
+        if np.issubdtype(np_dtype, np.integer):
+            count_max = np.iinfo(np_dtype).max - int(out_noData == np.iinfo(np_dtype).max)
+    ##### gap filling requires the whole band: in this case, bands are projected into in-memory datasets first
+    if(fill_nodata):
+        mem_ds = [gdal.GetDriverByName('MEM').Create('', col_number, row_number, 1, gdal_type) for i in range(no_of_bands)]
+        for ds in mem_ds:
+            if mask_band is None:
+                ds.GetRasterBand(1).SetNoDataValue(out_noData)
+        out_bands = [ds.GetRasterBand(1) for ds in mem_ds]
+    else:
+        out_bands = [dst_ds.GetRasterBand(i+1) for i in range(no_of_bands)]
+
+    ############ run projection block by block for all bands at once ##########
+    # (block height is a multiple of the tile size, so that peak memory does not depend on map size)
+    block_rows = max(256, int(block_pixels/col_number)//256*256)
+    for row_start in range(0, row_number, block_rows):
+        row_end = min(row_start+block_rows, row_number)
+        ##### assign mean (or other aggregate) of all image values (without no-Data pixels) to map pixels of this block
+        block_operator = operator[row_start*col_number:row_end*col_number]
+        if method == 'mean':
+            snow_val, count_array = project_stack(block_operator, None, masked = masked)
+        else:
+            snow_val, count_array = aggregate_groups(block_operator, masked, method)
+        if mask_band is not None:
+            write_mask(mask_band, (count_array>0) & ~np.isnan(snow_val), (row_end-row_start, col_number), row_start)
+        snow_val = convert_datatype(snow_val, count_array, np_dtype, out_noData, round_values)
+        ##### write output to tif-file
+        for i in range(no_of_bands):
+            out_bands[i].WriteArray(snow_val[:,i].reshape((row_end-row_start, col_number)), 0, row_start)
+        if count_band:
+            # (operator entries can be weights, therefore only their sign is used for counting)
+            count_val = np.minimum(block_operator.sign().dot(masked[1][:,0] if masked[1] is not None else np.ones(block_operator.shape[1])), count_max)
+            dst_ds.GetRasterBand(no_of_bands+1).WriteArray(count_val.astype(np_dtype).reshape((row_end-row_start, col_number)), 0, row_start)
+        del snow_val, count_array, block_operator
+
+    ######## optionnal: fill noData-gaps with small scale interpolation #######
+    # value of fill_nodata decides to what pixel range the interpolation is applied
+    # (all bands are filled in parallel & written to tif-file afterwards)
+    if(fill_nodata):
+        if mask_band is None:
+            fill_gaps(out_bands, fill_nodata)
+        # (filled pixels become valid in mask band)
+        else:
+            write_mask(mask_band, fill_gaps(out_bands, fill_nodata, mask_band.ReadAsArray() > 0).ravel(), (row_number, col_number))
+        for i in range(no_of_bands):
+            dst_ds.GetRasterBand(i+1).WriteArray(out_bands[i].ReadAsArray())
+        out_bands = None
+        mem_ds = None
+
+    ########## define geotransformation & projection and save result ##########
+    geotransform = tuple(lut['geotransform'])      # geotransformation from spatial extent and pixel size
+    dst_ds.SetGeoTransform(geotransform)           # set geotransfornation to tif-file
+
+    # get & define projection from DEM file and save result
+    dst_ds.SetProjection(pj_file)      # set projection to tif-file
+    dst_ds.FlushCache()                     # write to disk
+    dst_ds = None                           # save, close
+
+    ##### optional: convert result to Cloud-Optimized GeoTIFF with overviews
+    if cog:
+        aux_func.convert_to_cog(os.path.join(out_dir,tif_name), compress, predictor)
+
+    print (img_name + ' is processed')      # print to console, that processing of file x is finished
+#############################################################################################################
+
+
+
+############### place arrays in shared memory ###############################################################
+# input:
+#       - arrays: dictionary with numpy arrays
+def share_arrays(arrays):
+    # import required libraries
+    from multiprocessing import shared_memory
+    import numpy as np
+
+    ##### copy each array into its own shared memory block
+    # descriptor contains name, shape & dtype of each block and is passed to the worker processes
+    handles = list()
+    descriptor = dict()
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        handles.append(shm)
+        descriptor[key] = (shm.name, array.shape, array.dtype.str)
+    # return shared memory handles (needed to release memory later) and descriptor to main procedure
+    return handles, descriptor
+#############################################################################################################
+
+
+
+############### read arrays from shared memory ##############################################################
+# input:
+#       - descriptor: names, shapes & dtypes of shared memory blocks (see share_arrays)
+def attach_arrays(descriptor):
+    # import required libraries
+    from multiprocessing import shared_memory
+    import numpy as np
+
+    ##### create arrays on top of shared memory blocks (no copy)
+    handles = list()
+    arrays = dict()
+    for key, (name, shape, dtype) in descriptor.items():
+        shm = shared_memory.SharedMemory(name=name)
+        handles.append(shm)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    # return arrays and shared memory handles (have to be kept as long as arrays are used) to main procedure
+    return arrays, handles
+#############################################################################################################
+
+
+
+############### prepare worker process for parallel projection ##############################################
+# input:
+#       - descriptor: names, shapes & dtypes of shared projection operator arrays (see share_arrays)
+#       - params: dictionary with all other parameters needed by project_file
+worker_state = dict()
+def init_projection_worker(descriptor, params):
+    # import required libraries
+    from scipy.sparse import csr_matrix
+
+    ##### rebuild sparse projection operator on top of shared memory
+    arrays, handles = attach_arrays(descriptor)
+    worker_state['handles'] = handles
+    worker_state['operator'] = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(params['operator_shape']), copy=False)
+    worker_state['params'] = params
+#############################################################################################################
+
+
+
+############### project single file in worker process #######################################################
+# input:
+#       - img_file: tif-file in image projection, which should be projected
+def run_projection_worker(img_file):
+    params = worker_state['params']
+    project_file(img_file, worker_state['operator'], params['lut'], params['pj_file'], params['out_dir'], params['fill_nodata'], params['compress'], params['cog'], 
+                 params['out_dtype'], params['round_values'], params['method'], params['count_band'])
+#############################################################################################################
+
+
+
+############### project list of tif-files on a process pool #################################################
+# input:
+#       - img_file_list: list of tif-files in image projection, which should be projected
+#       - operator: sparse projection matrix (see projection_operator)
+#       - lut: lookup table between image and map pixels
+#       - pj_file: file which contains CRS information
+#       - out_dir: output directory where projected maps are stored
+#       - fill_nodata: if set, gaps in projected map are filled by interpolation within this pixel range
+#       - compress: compression of output tif-files ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - cog: if True, output is stored as Cloud-Optimized GeoTIFF with overviews
+#       - out_dtype: name of GDAL data type of output (e.g. 'Byte', 'Float32'); if None, data type of input is kept
+#       - round_values: if True, mean values are rounded for integer output; otherwise truncated
+#       - method: aggregation of image pixels assigned to a map pixel: 'mean', 'median', 'min', 'max', 'std' or 'mode'
+#       - count_band: if True, an additional band with the number of image pixels assigned to each map pixel is stored
+#       - workers: number of worker processes
+def project_files_parallel(img_file_list, operator, lut, pj_file, out_dir, fill_nodata=False, compress='DEFLATE', cog=False, out_dtype=None, round_values=True, 
+                           method='mean', count_band=False, workers=2):
+    # import required libraries
+    import multiprocessing
+
+    ##### place projection operator once in shared memory
+    handles, descriptor = share_arrays({'data': operator.data, 'indices': operator.indices, 'indptr': operator.indptr})
+    params = {'operator_shape': operator.shape,
+              'lut': {'map_shape': lut['map_shape'], 'geotransform': lut['geotransform']},
+              'pj_file': pj_file, 'out_dir': out_dir, 'fill_nodata': fill_nodata, 'compress': compress, 'cog': cog, 
+              'out_dtype': out_dtype, 'round_values': round_values, 'method': method, 'count_band': count_band}
+
+    ##### distribute files over worker processes
+    try:
+        with multiprocessing.Pool(min(workers, len(img_file_list)), initializer=init_projection_worker, initargs=(descriptor, params)) as pool:
+            for _ in pool.imap_unordered(run_projection_worker, img_file_list):
+                pass
+    ##### release shared memory
+    finally:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+#############################################################################################################
+
+
+
+############### calculate pixel window of raster, which covers the camera footprint #########################
+# input:
+#       - east, north: map coordinates of all valid image pixels
+#       - gt: geotransform of raster
+#       - raster_shape: shape of raster (rows, cols)
+#       - margin: number of pixels added to each side of the window
+def footprint_window(east, north, gt, raster_shape, margin = 2):
+    # import required libraries
+    import numpy as np
+
+    ##### no valid image pixel: nothing has to be read
+    if east.size == 0:
+        return None
+
+    ##### pixel positions of footprint extent (min/max of coordinates) in raster
+    x = (np.array([np.min(east), np.max(east)]) - gt[0]) / gt[1]
+    y = (np.array([np.min(north), np.max(north)]) - gt[3]) / gt[5]
+
+    ##### add margin & clip window to raster extent
+    x0 = max(int(np.floor(x.min())) - margin, 0)
+    x1 = min(int(np.ceil(x.max())) + margin + 1, raster_shape[1])
+    y0 = max(int(np.floor(y.min())) - margin, 0)
+    y1 = min(int(np.ceil(y.max())) + margin + 1, raster_shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    # return window as (xoff, yoff, xsize, ysize) to main procedure
+    return x0, y0, x1-x0, y1-y0
+#############################################################################################################
+
+
+
+############### sample raster window at fractional pixel positions (bilinear or cubic) #######################
+# input:
+#       - data: raster window (bands, rows, cols)
+#       - rows_pos, cols_pos: fractional pixel positions (row, col) inside window, at which data is sampled
+#       - resampling: 'bilinear' or 'cubic'
+#       - noDataVal: no-Data-value of data; positions, whose kernel touches a no-Data pixel, are set invalid
+def sample_window(data, rows_pos, cols_pos, resampling = 'bilinear', noDataVal = None):
+    # import required libraries
+    from scipy import ndimage
+    import numpy as np
+    import sys
+
+    if resampling == 'bilinear':
+        order = 1
+    elif resampling == 'cubic':
+        order = 3
+    else:
+        print('Error: unknown resampling kernel ' + str(resampling))
+        sys.exit(1)
+
+    coords = np.vstack((rows_pos, cols_pos))
+    values = np.empty((data.shape[0], coords.shape[1]))
+    valid = np.empty(values.shape, dtype=bool)
+    for b in range(data.shape[0]):
+        band = data[b].astype(np.float64)
+        invalid = np.isnan(band)
+        if noDataVal is not None:
+            invalid |= (band == noDataVal)
+
+        ##### replace no-Data pixels by nearest valid value, so they do not spread into the interpolation
+        if invalid.all():
+            values[b] = 0
+            valid[b] = False
+            continue
+        if invalid.any():
+            idx = ndimage.distance_transform_edt(invalid, return_distances=False, return_indices=True)
+            band = band[tuple(idx)]
+            # cubic kernel covers 4x4 pixels, bilinear kernel 2x2 pixels
+            if order == 3:
+                invalid = ndimage.maximum_filter(invalid, size=3)
+            valid[b] = ndimage.map_coordinates(invalid.astype(np.float32), coords, order=1, mode='nearest') <= 0
+        else:
+            valid[b] = True
+
+        ##### interpolate all positions in one call
+        values[b] = ndimage.map_coordinates(band, coords, order=order, mode='nearest')
+    # return interpolated values & validity to main procedure
+    return values, valid
+#############################################################################################################
+
+
+
+############### calculate corresponding geotif pixel for all valid image pixels (projection to image plane) ##
+# input:
+#       - img_px: flat index of all valid image pixels
+#       - east, north: map coordinates of all valid image pixels
+#       - gt: geotransform of geotif
+#       - raster_shape: shape of geotif (rows, cols)
+def calculate_image_index(img_px, east, north, gt, raster_shape):
+    # import required libraries
+    import numpy as np
+
+    ##### identify corresponding map pixel for all image pixels at once
+    x = (east - gt[0]) / gt[1] #fractional x pixel position in raster
+    y = (north - gt[3]) / gt[5] #fractional y pixel position in raster
+    px = np.round(x).astype(np.int64) #x pixel position in raster
+    py = np.round(y).astype(np.int64) #y pixel position in raster
+    inside = (px>=0) & (px<raster_shape[1]) & (py>=0) & (py<raster_shape[0])
+
+    ##### window covering the camera footprint; positions are stored relative to this window
+    window = footprint_window(east, north, gt, raster_shape)
+    if window is None or not inside.any():
+        return {'window': None}
+    xoff, yoff = window[0], window[1]
+    # return window, target image pixels & (fractional) positions in window to main procedure
+    return {'window': window, 'img_px': img_px[inside],
+            'rows': py[inside]-yoff, 'cols': px[inside]-xoff,
+            'rows_pos': y[inside]-yoff, 'cols_pos': x[inside]-xoff}
+#############################################################################################################
+
+
+
+############### load image plane index from memory cache or calculate it ####################################
+# input:
+#       - coord_key: hash of coordinate rasters & mask (see hash_coordinate_rasters)
+#       - img_px, east, north: flat index & map coordinates of all valid image pixels
+#       - gt: geotransform of geotif
+#       - raster_shape: shape of geotif (rows, cols)
+image_index_cache = {}
+def get_image_index(coord_key, img_px, east, north, gt, raster_shape):
+    ##### co-registered geotifs (same geotransform & shape) share one index
+    key = (coord_key, tuple(gt), tuple(raster_shape))
+    if key not in image_index_cache:
+        image_index_cache[key] = calculate_image_index(img_px, east, north, gt, raster_shape)
+    return image_index_cache[key]
+#############################################################################################################
+
+
+
+############### find image position (col, row) of map coordinates ###########################################
+# input:
+#       - tree, tree_px: KD-tree over map coordinates of image pixels & their flat image index (see get_coordinate_tree)
+#       - img_cols: number of columns of image
+#       - easting, northing: map coordinates, which should be located in image
+#       - max_distance: maximum distance (in map units) to nearest image pixel; points further away are set to NaN
+#       - k: number of nearest image pixels checked for ties (more ties are collected with a radius search)
+# position is the mean (col, row) of all image pixels with minimal distance to the point
+def locate_in_image(tree, tree_px, img_cols, easting, northing, max_distance = None, k = 8):
+    # import required libraries
+    import numpy as np
+
+    col = np.full(len(easting), np.nan)
+    row = np.full(len(easting), np.nan)
+    ok = np.flatnonzero(~(np.isnan(easting) | np.isnan(northing)))
+    if len(ok) == 0 or tree.n == 0:
+        return col, row
+    pts = np.column_stack((easting[ok], northing[ok]))
+
+    ##### query k nearest image pixels of all points at once
+    k = min(k, tree.n)
+    dist, idx = tree.query(pts, k=k)
+    idx = idx.reshape((len(ok), k))
+    # squared distances (as used to find the minimum) decide about ties
+    cand = tree.data[idx]
+    dist2 = (cand[:,:,1]-pts[:,1:2])**2 + (cand[:,:,0]-pts[:,0:1])**2
+    ties = dist2 == dist2.min(axis=1, keepdims=True)
+    cand_px = tree_px[idx]
+    col[ok] = np.sum((cand_px % img_cols)*ties, axis=1) / np.sum(ties, axis=1)
+    row[ok] = np.sum((cand_px // img_cols)*ties, axis=1) / np.sum(ties, axis=1)
+
+    ##### all k nearest pixels have the same distance: collect all tied pixels with a radius search
+    if k < tree.n:
+        for j in np.flatnonzero(ties.all(axis=1)):
+            d_min = dist2[j].min()
+            cand = np.array(tree.query_ball_point(pts[j], np.sqrt(d_min)*(1+1e-9)+1e-9))
+            cand_d2 = (tree.data[cand,1]-pts[j,1])**2 + (tree.data[cand,0]-pts[j,0])**2
+            cand_px = tree_px[cand[cand_d2 == d_min]]
+            col[ok[j]] = np.mean(cand_px % img_cols)
+            row[ok[j]] = np.mean(cand_px // img_cols)
+
+    ##### mark points outside of camera view
+    if max_distance is not None:
+        far = dist.reshape((len(ok), k))[:,0] > max_distance
+        col[ok[far]] = np.nan
+        row[ok[far]] = np.nan
+    # return image column & row of all points to main procedure
+    return col, row
+#############################################################################################################
+
+
+
+############### extract all vertices of a geometry as array ##################################################
+# input:
+#       - geom: OGR geometry (point, line, polygon, multi-geometry or collection; polygons incl. holes)
+# returns list of all single parts (points, lines & rings) and array of their vertices (x, y, z)
+def get_vertices(geom):
+    # import required libraries
+    import numpy as np
+
+    ##### collect all parts, which contain vertices
+    parts = []
+    stack = [geom] if geom is not None else []
+    while stack:
+        g = stack.pop()
+        if g.GetGeometryCount() > 0:
+            stack += [g.GetGeometryRef(i) for i in reversed(range(g.GetGeometryCount()))]
+        elif g.GetPointCount() > 0:
+            parts.append(g)
+
+    ##### read vertices of all parts (2-D vertices get z=0)
+    xyz = np.zeros((sum([p.GetPointCount() for p in parts]), 3))
+    start = 0
+    for p in parts:
+        pts = np.array(p.GetPoints(), dtype=float)
+        xyz[start:start+len(pts), :pts.shape[1]] = pts
+        start += len(pts)
+    # return parts & vertices to main procedure
+    return parts, xyz
+#############################################################################################################
+
+
+
+############### write array of vertices back to geometry #####################################################
+# input:
+#       - parts: single parts of geometry (see get_vertices)
+#       - xyz: new vertices (x, y, z) of all parts; z is only used by 3-D geometries
+def set_vertices(parts, xyz):
+    start = 0
+    for p in parts:
+        n = p.GetPointCount()
+        if p.GetCoordinateDimension() == 3:
+            for i, (x, y, z) in enumerate(xyz[start:start+n].tolist()):
+                p.SetPoint(i, x, y, z)
+        else:
+            for i, (x, y, z) in enumerate(xyz[start:start+n].tolist()):
+                p.SetPoint_2D(i, x, y)
+        start += n
+#############################################################################################################
+
+
+
+############### interpolate map coordinates at fractional image positions (bilinear) ########################
+# input:
+#       - east, north: coordinate rasters
+#       - row, col: fractional image positions (pixel centers at integer positions)
+# if one of the four neighbouring pixels has no coordinates, the coordinates of the closest valid neighbour are used
+def interpolate_coordinates(east, north, row, col):
+    # import required libraries
+    import numpy as np
+
+    rows, cols = east.shape
+    easting = np.full(len(row), np.nan)
+    northing = np.full(len(row), np.nan)
+    ##### positions inside the image (incl. outer half of border pixels)
+    inside = np.flatnonzero((row>=-0.5) & (row<rows-0.5) & (col>=-0.5) & (col<cols-0.5))
+    r = np.clip(row[inside], 0, rows-1)
+    c = np.clip(col[inside], 0, cols-1)
+
+    ##### four neighbouring pixels & bilinear weights
+    r0 = np.minimum(np.floor(r).astype(np.int64), max(rows-2, 0))
+    c0 = np.minimum(np.floor(c).astype(np.int64), max(cols-2, 0))
+    r1 = np.minimum(r0+1, rows-1)
+    c1 = np.minimum(c0+1, cols-1)
+    fr, fc = r-r0, c-c0
+    nb_r = np.stack((r0, r0, r1, r1), axis=1)
+    nb_c = np.stack((c0, c1, c0, c1), axis=1)
+    weights = np.stack(((1-fr)*(1-fc), (1-fr)*fc, fr*(1-fc), fr*fc), axis=1)
+    nb_east, nb_north = east[nb_r, nb_c], north[nb_r, nb_c]
+    valid = ~(np.isnan(nb_east) | np.isnan(nb_north))
+
+    ##### all neighbours valid: bilinear interpolation
+    full = valid.all(axis=1)
+    easting[inside[full]] = np.sum(weights[full]*nb_east[full], axis=1)
+    northing[inside[full]] = np.sum(weights[full]*nb_north[full], axis=1)
+
+    ##### some neighbours without coordinates (e.g. close to skyline): use closest valid neighbour
+    part = np.flatnonzero(~full & valid.any(axis=1))
+    dist = (nb_r[part]-r[part,None])**2 + (nb_c[part]-c[part,None])**2
+    dist[~valid[part]] = np.inf
+    nearest = np.argmin(dist, axis=1)
+    easting[inside[part]] = nb_east[part, nearest]
+    northing[inside[part]] = nb_north[part, nearest]
+    # return interpolated coordinates to main procedure
+    return easting, northing
+#############################################################################################################
+
+
+
+############### project vertices from map to image plane or from image plane to map ##########################
+# input:
+#       - xyz: vertices (x, y, z); map coordinates or image coordinates (x: col, y: -row)
+#       - coords: dictionary with east & north raster and (only to image view) KD-tree & flat index of tree points
+#       - to_image_view: if True, vertices are projected from map to image plane; otherwise from image plane to map
+#       - max_distance: maximum distance (in map units) between vertex and nearest image pixel (only to image view)
+def project_vertices(xyz, coords, to_image_view = True, max_distance = None):
+    xyz_out = xyz.copy()
+    east, north = coords['east'], coords['north']
+    ##### to image plane: image position of nearest pixel (image y-axis points upwards)
+    if to_image_view:
+        col, row = locate_in_image(coords['tree'], coords['tree_px'], east.shape[1], xyz[:,0], xyz[:,1], max_distance)
+        xyz_out[:,0] = col
+        xyz_out[:,1] = -row
+    ##### to map: bilinear interpolation of coordinate rasters at image position (NaN outside of image)
+    else:
+        xyz_out[:,0], xyz_out[:,1] = interpolate_coordinates(east, north, -xyz[:,1], xyz[:,0])
+    # return projected vertices to main procedure
+    return xyz_out
+#############################################################################################################
+
+
+
+############### project geometries of a batch of features & store them in output layer #######################
+# input:
+#       - batch: list of input features
+#       - layer_out: output layer
+#       - coords, to_image_view, max_distance: see project_vertices
+#       - field_map: index of output field for each input field (computed once per layer; -1: field is skipped)
+#       - geom_type: if given, geometries are converted to this type (e.g. multi-geometries for GeoPackage & FlatGeobuf)
+# vertices of all features in the batch are projected at once
+def write_feature_batch(batch, layer_out, coords, to_image_view = True, max_distance = None, field_map = None, geom_type = None):
+    # import required libraries
+    import osgeo.ogr as ogr
+    import numpy as np
+
+    ##### extract vertices of all features
+    geoms, parts, vertices = [], [], []
+    for feature in batch:
+        geom = feature.GetGeometryRef()
+        geom = geom.Clone() if geom is not None else None
+        p, xyz = get_vertices(geom)
+        geoms.append(geom)
+        parts.append(p)
+        vertices.append(xyz)
+    n_vertices = np.cumsum([0] + [len(xyz) for xyz in vertices])
+
+    ##### project all vertices at once
+    xyz = project_vertices(np.concatenate(vertices), coords, to_image_view, max_distance)
+
+    ##### store new position and copy variable values to output layer
+    layerDefinition = layer_out.GetLayerDefn()
+    if field_map is None:
+        field_map = list(range(layerDefinition.GetFieldCount()))
+    for j, feature in enumerate(batch):
+        set_vertices(parts[j], xyz[n_vertices[j]:n_vertices[j+1]])
+        feature_out = ogr.Feature(layerDefinition)
+        feature_out.SetFromWithMap(feature, 1, field_map)
+        geom = geoms[j]
+        if geom is not None and geom_type is not None and geom.GetGeometryType() != geom_type:
+            geom = ogr.ForceTo(geom, geom_type)
+        feature_out.SetGeometry(geom)
+        # Create the feature in the layer
+        layer_out.CreateFeature(feature_out)
+        feature_out = None
+#############################################################################################################
+
+
+
+############### derive polygon of camera footprint from coordinate rasters & mask ############################
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - cells: number of grid cells along the longer side of the footprint extent
+# map coordinates of all valid image pixels are binned into a grid, small gaps are closed (dilation)
+# & the grid is converted into a (multi-)polygon, which follows the outline of the covered area
+def calculate_footprint(coord_dir, cells = 500):
+    # import required libraries
+    import osgeo.ogr as ogr
+    from scipy import ndimage
+    import numpy as np
+    import gdal
+
+    ##### map coordinates of all valid image pixels inside mask
+    rasters = read_coordinate_rasters(coord_dir)
+    valid = ~(rasters['mask']==0) & ~np.isnan(rasters['mask']) & ~np.isnan(rasters['east_raster']) & ~np.isnan(rasters['north_raster'])
+    east, north = rasters['east_raster'][valid], rasters['north_raster'][valid]
+    if east.size == 0:
+        return None
+
+    ##### bin coordinates into grid covering the footprint extent (with border of 2 cells)
+    cell = max(np.max(east)-np.min(east), np.max(north)-np.min(north)) / cells
+    if cell == 0:
+        cell = 1.
+    x0, y0 = np.min(east) - 2*cell, np.max(north) + 2*cell
+    cols = int((np.max(east)-x0)/cell) + 3
+    rows = int((y0-np.min(north))/cell) + 3
+    grid = np.zeros((rows, cols), dtype=np.uint8)
+    grid[((y0-north)/cell).astype(np.int64), ((east-x0)/cell).astype(np.int64)] = 1
+    grid = ndimage.binary_dilation(grid, iterations=2).astype(np.uint8)
+
+    ##### convert grid to polygons & merge them
+    mem_ds = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, gdal.GDT_Byte)
+    mem_ds.SetGeoTransform((x0, cell, 0, y0, 0, -cell))
+    band = mem_ds.GetRasterBand(1)
+    band.WriteArray(grid)
+    vec_ds = ogr.GetDriverByName('Memory').CreateDataSource('')
+    vec_layer = vec_ds.CreateLayer('footprint', None, ogr.wkbPolygon)
+    vec_layer.CreateField(ogr.FieldDefn('value', ogr.OFTInteger))
+    gdal.Polygonize(band, band, vec_layer, 0, [], callback=None)
+    footprint = ogr.Geometry(ogr.wkbMultiPolygon)
+    for feature in vec_layer:
+        footprint.AddGeometry(feature.GetGeometryRef())
+    # return footprint polygon to main procedure
+    return footprint.UnionCascaded()
+#############################################################################################################
+
+
+
+############### load camera footprint from cache or calculate & store it next to coordinate rasters ##########
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - cells: number of grid cells along the longer side of the footprint extent
+def get_footprint(coord_dir, cells = 500):
+    # import required libraries
+    import osgeo.ogr as ogr
+    import os, tempfile
+
+    ##### footprint is stored as WKT next to coordinate rasters,
+    # key of the file is the hash of the rasters and the grid size
+    footprint_file = os.path.join(coord_dir, 'footprint_'+hash_coordinate_rasters(coord_dir, ('footprint', int(cells)))+'.wkt')
+    if os.path.isfile(footprint_file):
+        with open(footprint_file, 'r') as f:
+            wkt = f.read()
+        return ogr.CreateGeometryFromWkt(wkt) if wkt else None
+
+    ##### calculate footprint once & store it for all later runs
+    footprint = calculate_footprint(coord_dir, cells)
+    fd, tmp_file = tempfile.mkstemp(suffix='.wkt', dir=coord_dir)
+    with os.fdopen(fd, 'w') as f:
+        f.write(footprint.ExportToWkt() if footprint is not None else '')
+    os.replace(tmp_file, footprint_file)
+    # return footprint polygon to main procedure
+    return footprint
+#############################################################################################################
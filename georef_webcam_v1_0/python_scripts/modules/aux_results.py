@@ -3,7 +3,7 @@
 """
 #############################################################################################################
 Created on Mon May 11 2020
-Last edited on Tue Jun 29 2021
+Last edited on Sun Oct 18 2026
 
 Author: Sebastian Buchelt
 
@@ -26,13 +26,35 @@ Author: Sebastian Buchelt
 %   Overview:   select_PRACTISE_files: selects PRACTISE output file from given 
 %                       directory and PRACTISE execution run
 %               get_data_from_PRACTISE: reads data from octave mat-files
+%               create_geotiff: creates empty single-band geotiff
 %               write_array_as_geotiff: exports an array as a geotiff (used to 
 %                       generate coordinate and mask rasters)
+%               finish_geotiff: converts geotiff to Cloud-Optimized GeoTIFF
 %               interpolate_raster: interpolates coordinate arrays from
 %                       projected DEM points
+%               calculate_interpolation_weights: calculates index of points &
+%                       weights used to interpolate each pixel
+%               calculate_weights_key: calculates hash of points, grid & 
+%                       interpolation type (key of cached weights)
+%               get_interpolation_weights: loads interpolation weights from
+%                       cache or calculates & stores them
+%               apply_interpolation_weights: calculates raster as weighted sum
+%                       of point data
+%               calculate_strip_reach: calculates rows, from which points can
+%                       change the interpolation of a strip
+%               init_strip_worker: prepares worker process for strip-wise 
+%                       interpolation
+%               interpolate_strip: interpolates rasters for a strip of rows
+%                       (worker of interpolate_rasters_tiled)
+%               interpolate_rasters_tiled: interpolates rasters strip by strip
+%                       on a process pool & streams them into geotiffs
 %               calculate_distance_raster: calculates distance of image pixel 
 %                       to closest projected DEM pixel (needed for mask layer)
 %               create_mask: generates mask to filter area above skyline
+%               calculate_skyline: derives skyline (top row of projected DEM 
+%                       points in each image column) directly from the points
+%               create_skyline_mask: generates mask from skyline
+%               export_skyline: stores skyline as polyline (shp) & json-file
 %               call_project_image: calls image projection procedure
 %               read_png: aux function to read png data into array
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
@@ -82,20 +104,54 @@ def get_data_from_PRACTISE(PRACTISE_result, line, single_value = False):
 
 
 
-############### write raster as tif-file (e.g. coordinate rasters, mask,...) ################################
+############### create empty single-band tif-file ###########################################################
 # input:
-#       - array: data array to be exported
 #       - out_dir: out_dir to store data
 #       - filename: name of tif-file to store data
-def write_array_as_geotiff(array, out_dir, filename):
+#       - rows, cols: size of raster
+#       - data_type: name of GDAL data type (e.g. 'Float32', 'Byte')
+#       - nodata: no-Data-value (None: no no-Data-value is set)
+#       - compress: compression of tif-file ('DEFLATE', 'ZSTD', 'LZW' or 'NONE'); floating point data uses predictor 3
+#       - nbits: number of bits per pixel (e.g. 1 for masks stored as Byte)
+def create_geotiff(out_dir, filename, rows, cols, data_type = 'Float32', nodata = None, compress = 'DEFLATE', nbits = None):
     # import required libraries
     import gdal, os
+    import modules.aux_functions as aux_func
 
-    ##### create tif-file 
+    ##### create tiled & compressed tif-file 
     driver = gdal.GetDriverByName('GTiff')
     driver.Register()
+    options = aux_func.geotiff_options(compress, 3 if data_type.startswith('Float') else None)
+    if nbits:
+        options += ['NBITS='+str(nbits)]
+    outDs = driver.Create(os.path.join(out_dir,filename), cols, rows, 1, gdal.GetDataTypeByName(data_type), options = options)
+    if nodata is not None:
+        outDs.GetRasterBand(1).SetNoDataValue(nodata)       # define no-Data-value
+    # return dataset to main procedure
+    return outDs
+#############################################################################################################
+
+
+
+############### write raster as tif-file (e.g. coordinate rasters, mask,...) ################################
+# input:
+#       - array: data array to be exported
+#       - out_dir: out_dir to store data
+#       - filename: name of tif-file to store data
+#       - data_type: name of GDAL data type (e.g. 'Float32'; masks: 'Byte')
+#       - nodata: no-Data-value (default: NaN for floating point data)
+#       - compress: compression of tif-file ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - cog: if True, tif-file is converted to Cloud-Optimized GeoTIFF with overviews
+#       - nbits: number of bits per pixel (e.g. 1 for masks)
+def write_array_as_geotiff(array, out_dir, filename, data_type = 'Float32', nodata = 'default', compress = 'DEFLATE', cog = False, nbits = None):
+    # import required libraries
+    import os
+
+    ##### create tif-file 
     (rows, cols)=array.shape
-    outDs = driver.Create(os.path.join(out_dir,filename), cols, rows, 1, gdal.GDT_Float32)
+    if nodata == 'default':
+        nodata = float('nan') if data_type.startswith('Float') else None
+    outDs = create_geotiff(out_dir, filename, rows, cols, data_type, nodata, compress, nbits)
     
     ##### write data into tif-file
     outBand = outDs.GetRasterBand(1)
@@ -103,6 +159,28 @@ def write_array_as_geotiff(array, out_dir, filename):
     outBand.FlushCache()
     outBand = None
     outDs = None
+    
+    ##### convert to Cloud-Optimized GeoTIFF
+    if cog:
+        finish_geotiff(os.path.join(out_dir, filename), data_type, compress)
+#############################################################################################################
+
+
+
+############### convert tif-file to Cloud-Optimized GeoTIFF ##################################################
+# input:
+#       - tif_file: tif-file, which should be converted
+#       - data_type: name of GDAL data type of tif-file
+#       - compress: compression of tif-file ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+def finish_geotiff(tif_file, data_type = 'Float32', compress = 'DEFLATE'):
+    # import required libraries
+    import modules.aux_functions as aux_func
+    
+    ##### floating point data: averaged overviews; other data (e.g. masks): nearest neighbour overviews
+    if data_type.startswith('Float'):
+        aux_func.convert_to_cog(tif_file, compress, 3, 'AVERAGE')
+    else:
+        aux_func.convert_to_cog(tif_file, compress, None, 'NEAREST')
 #############################################################################################################
    
     
@@ -115,16 +193,328 @@ def write_array_as_geotiff(array, out_dir, filename):
 #       - out_dir: out_dir to store data
 #       - filename: name of tif-file to store data
 #       - interpolation_type: way to interpolate data: 'nearest': Nearest Neighbour; 'linear': Bilinear
-def interpolate_raster(data, points, interpolation_grid, out_dir, filename, interpolation_type = 'nearest'):
+#       - weights: interpolation weights of points & grid (see get_interpolation_weights); 
+#                  if given, the raster is calculated as weighted sum of data without new triangulation
+#       - compress, cog: compression & Cloud-Optimized GeoTIFF layout of tif-file (see write_array_as_geotiff)
+def interpolate_raster(data, points, interpolation_grid, out_dir, filename, interpolation_type = 'nearest', weights = None, 
+                       compress = 'DEFLATE', cog = False):
     # import required libraries
     from scipy.interpolate import griddata
     ##### interpolate raster and save interpolated array in tif-file
-    raster = griddata(points, data, (interpolation_grid[0], interpolation_grid[1]), method=interpolation_type)
-    write_array_as_geotiff(raster, out_dir, filename)
+    if weights is None:
+        raster = griddata(points, data, (interpolation_grid[0], interpolation_grid[1]), method=interpolation_type)
+    ##### weighted sum of data at points of each pixel (NaN outside of triangulation)
+    else:
+        raster = apply_interpolation_weights(data, weights, interpolation_grid[0].shape)
+    write_array_as_geotiff(raster, out_dir, filename, compress = compress, cog = cog)
     # return array with interpolated data to main procedure
     return raster
 #############################################################################################################
+
+
+
+############### calculate index of points & weights used to interpolate each pixel ##########################
+# input:
+#       - points: location of the point in the grid
+#       - interpolation_grid: grid to which the data is interpolated
+#       - interpolation_type: 'nearest': index of closest point; 'linear': index of triangle corners & barycentric weights
+#       - chunk_pixels: approximate number of pixels, for which index & weights are calculated at once
+# index is stored as int32 & weights as float32 (see apply_interpolation_weights)
+def calculate_interpolation_weights(points, interpolation_grid, interpolation_type = 'nearest', chunk_pixels = 2**20):
+    # import required libraries
+    from scipy.spatial import Delaunay, cKDTree
+    import numpy as np
     
+    points = np.asarray(points, dtype=np.float64)
+    rows, cols = interpolation_grid[0].shape
+    ##### nearest neighbour: index of closest point for each pixel
+    if interpolation_type == 'nearest':
+        search = cKDTree(points)
+        index = np.empty(rows*cols, dtype=np.int32)
+        weights = None
+    ##### bilinear: triangulate points once, find triangle of each pixel & calculate barycentric weights
+    else:
+        tri = Delaunay(points)
+        index = np.empty((rows*cols, 3), dtype=np.int32)
+        weights = np.empty((rows*cols, 3), dtype=np.float32)
+    
+    ##### process grid in chunks of rows, so that temporary arrays stay small
+    chunk_rows = max(1, chunk_pixels//cols)
+    for row_start in range(0, rows, chunk_rows):
+        row_end = min(row_start+chunk_rows, rows)
+        px = slice(row_start*cols, row_end*cols)
+        grid_pts = np.column_stack((interpolation_grid[0][row_start:row_end].ravel(), interpolation_grid[1][row_start:row_end].ravel())).astype(np.float64)
+        if weights is None:
+            index[px] = search.query(grid_pts)[1]
+            continue
+        simplex = tri.find_simplex(grid_pts)
+        transform = tri.transform[simplex]
+        bary = np.einsum('ijk,ik->ij', transform[:,:2,:], grid_pts-transform[:,2,:])
+        index[px] = tri.simplices[simplex]
+        weights[px] = np.column_stack((bary, 1-bary.sum(axis=1)))
+        # pixels outside of triangulation
+        index[px][simplex < 0] = -1
+        weights[px][simplex < 0] = 0
+        del grid_pts, simplex, transform, bary
+    # return index & weights to main procedure
+    return {'index': index, 'weights': weights}
+#############################################################################################################
+
+
+
+############### calculate hash of points, grid shape & interpolation type (key of cached weights) ##########
+# input:
+#       - points: location of the point in the grid
+#       - interpolation_grid: grid to which the data is interpolated
+#       - interpolation_type: 'nearest' or 'linear'
+def calculate_weights_key(points, interpolation_grid, interpolation_type):
+    # import required libraries
+    import hashlib
+    import numpy as np
+    
+    ##### hash of points, grid shape & interpolation type
+    key = hashlib.sha1(np.ascontiguousarray(points, dtype=np.float64).tobytes())
+    key.update(repr((tuple(interpolation_grid[0].shape), interpolation_type)).encode())
+    # return hash as hex string to main procedure
+    return key.hexdigest()
+#############################################################################################################
+
+
+
+############### load interpolation weights from cache or calculate & store them #############################
+# input:
+#       - points: location of the point in the grid
+#       - interpolation_grid: grid to which the data is interpolated
+#       - out_dir: directory, where weights are stored (cache directory, which is created if needed)
+#       - interpolation_type: 'nearest' or 'linear'
+def get_interpolation_weights(points, interpolation_grid, out_dir, interpolation_type = 'nearest'):
+    # import required libraries
+    import os, tempfile
+    import numpy as np
+    
+    ##### weights are stored compressed in out_dir, re-running the same PRACTISE run skips the triangulation
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    weights_file = os.path.join(out_dir, 'weights_'+calculate_weights_key(points, interpolation_grid, interpolation_type)+'.npz')
+    if os.path.isfile(weights_file):
+        with np.load(weights_file) as cached:
+            return {'index': cached['index'], 'weights': cached['weights'] if 'weights' in cached.files else None}
+    
+    ##### calculate weights once & store them for all later runs
+    print('Calculate interpolation weights...')
+    weights = calculate_interpolation_weights(points, interpolation_grid, interpolation_type)
+    fd, tmp_file = tempfile.mkstemp(suffix='.npz', dir=out_dir)
+    with os.fdopen(fd, 'wb') as f:
+        np.savez_compressed(f, **{k: v for k, v in weights.items() if v is not None})
+    os.replace(tmp_file, weights_file)
+    # return index & weights to main procedure
+    return weights
+#############################################################################################################
+    
+
+
+############### calculate raster as weighted sum of point data ##############################################
+# input:
+#       - data: data at points
+#       - weights: index of points & weights of each pixel (see calculate_interpolation_weights)
+#       - shape: shape of raster
+def apply_interpolation_weights(data, weights, shape):
+    # import required libraries
+    import numpy as np
+    
+    data = np.asarray(data, dtype=np.float64)
+    ##### nearest neighbour: data of closest point
+    if weights['weights'] is None:
+        raster = data[weights['index']]
+    ##### bilinear: weighted sum of triangle corners (NaN outside of triangulation)
+    # (relative to third corner, so that float32 weights are precise also for large coordinates)
+    else:
+        index = weights['index']
+        raster = data[index[:,2]]
+        raster = raster + weights['weights'][:,0]*(data[index[:,0]]-raster) + weights['weights'][:,1]*(data[index[:,1]]-raster)
+        raster[index[:,0] < 0] = np.nan
+    # return raster to main procedure
+    return raster.reshape(shape)
+#############################################################################################################
+
+
+
+############### rows, from which points can change the interpolation of a strip ###########################
+# input:
+#       - points: points used to interpolate the strip
+#       - grid_pts: pixels of the strip (row, col)
+#       - weights: index of points & weights of each pixel (see calculate_interpolation_weights)
+# nearest: circle around each pixel through its closest point; linear: circumcircle of each used triangle 
+# (Delaunay criterion); points outside of these circles cannot change the result
+def calculate_strip_reach(points, grid_pts, weights):
+    # import required libraries
+    import numpy as np
+    
+    ##### nearest neighbour: distance of pixel to its closest point
+    if weights['weights'] is None:
+        dist = np.hypot(*(grid_pts-points[weights['index']]).T)
+        return np.min(grid_pts[:,0]-dist), np.max(grid_pts[:,0]+dist)
+    
+    ##### bilinear: circumcircles of triangles, which are used by at least one pixel
+    simplices = np.unique(weights['index'][weights['index'][:,0] >= 0], axis=0)
+    if len(simplices) == 0:
+        return np.inf, -np.inf
+    (ax, ay), (bx, by), (cx, cy) = [points[simplices[:,i]].T for i in range(3)]
+    d = 2*(ax*(by-cy)+bx*(cy-ay)+cx*(ay-by))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ux = ((ax**2+ay**2)*(by-cy)+(bx**2+by**2)*(cy-ay)+(cx**2+cy**2)*(ay-by))/d
+        uy = ((ax**2+ay**2)*(cx-bx)+(bx**2+by**2)*(ax-cx)+(cx**2+cy**2)*(bx-ax))/d
+    radius = np.hypot(ax-ux, ay-uy)
+    # degenerated (flat) triangles: all points are needed
+    if not np.all(np.isfinite(radius)):
+        return -np.inf, np.inf
+    return np.min(ux-radius), np.max(ux+radius)
+#############################################################################################################
+
+
+
+############### prepare worker process for strip-wise interpolation #########################################
+# input:
+#       - points: location of all points sorted by row
+#       - data_list: data of all points (same order as points)
+#       - hull_pts: corners of convex hull of all points (None for nearest neighbour interpolation or if all points lie on one line)
+#       - cols: number of columns of the rasters
+#       - interpolation_type: 'nearest' or 'linear'
+#       - cam_pos: camera position (None: no distance raster)
+#       - halo: initial number of rows above & below each strip, from which points are used
+strip_state = dict()
+def init_strip_worker(points, data_list, hull_pts, cols, interpolation_type, cam_pos, halo):
+    strip_state.update({'points': points, 'data_list': data_list, 'hull_pts': hull_pts, 'cols': cols, 
+                        'interpolation_type': interpolation_type, 'cam_pos': cam_pos, 'halo': max(int(halo), 1)})
+#############################################################################################################
+
+
+
+############### interpolate rasters for a strip of rows (worker of interpolate_rasters_tiled) ################
+# input:
+#       - task: tuple with first & last row (excl.) of strip
+# points of the strip plus halo are triangulated once for all rasters of the strip; the halo is extended, 
+# until no point outside of it can change the result (result equals interpolation with all points)
+def interpolate_strip(task):
+    # import required libraries
+    from scipy.spatial import Delaunay, QhullError
+    import numpy as np
+    
+    row_start, row_end = task
+    points, interpolation_type = strip_state['points'], strip_state['interpolation_type']
+    shape = (row_end-row_start, strip_state['cols'])
+    grid = np.broadcast_arrays(*np.ogrid[row_start:row_end, 0:shape[1]])
+    grid_pts = np.column_stack((grid[0].ravel(), grid[1].ravel())).astype(np.float64)
+    min_points = 1 if interpolation_type == 'nearest' else 3
+    
+    ##### select points of strip & halo, extend halo until result does not depend on points outside of it
+    top, bottom = row_start-strip_state['halo'], row_end+strip_state['halo']
+    while True:
+        lo = np.searchsorted(points[:,0], top, 'left')
+        hi = np.searchsorted(points[:,0], bottom, 'right')
+        weights = None
+        reach_top, reach_bottom, incomplete = top, bottom, hi-lo < min_points
+        if not incomplete:
+            try:
+                weights = calculate_interpolation_weights(points[lo:hi], grid, interpolation_type)
+            # all selected points on one line (e.g. flat horizon on one image row): no triangulation possible
+            except QhullError:
+                incomplete = True
+        if weights is not None:
+            reach_top, reach_bottom = calculate_strip_reach(points[lo:hi], grid_pts, weights)
+            # pixels outside of triangulation of selected points, but inside of triangulation of all points
+            if weights['weights'] is not None:
+                outside = weights['index'][:,0] < 0
+                incomplete = np.any(outside) and np.any(Delaunay(strip_state['hull_pts']).find_simplex(grid_pts[outside]) >= 0)
+        extend_top = lo > 0 and (incomplete or reach_top < top)
+        extend_bottom = hi < len(points) and (incomplete or reach_bottom > bottom)
+        if not (extend_top or extend_bottom):
+            break
+        # double halo or extend it to rows reached by circles
+        if extend_top:
+            top = min(reach_top, row_start-2*(row_start-top))
+        if extend_bottom:
+            bottom = max(reach_bottom, row_end+2*(bottom-row_end))
+    
+    ##### too few points or all points on one line: no data
+    if weights is None:
+        strips = [np.full(shape, np.nan) for data in strip_state['data_list']]
+    else:
+        strips = [apply_interpolation_weights(data[lo:hi], weights, shape) for data in strip_state['data_list']]
+    ##### distance to camera (first two rasters are easting & northing)
+    cam_pos = strip_state['cam_pos']
+    if cam_pos is not None:
+        strips.append(np.sqrt((strips[0]-cam_pos[0])**2+(strips[1]-cam_pos[1])**2))
+    # return interpolated strips to main procedure
+    return strips
+#############################################################################################################
+
+
+
+############### interpolate rasters strip by strip on a process pool & stream them into tif-files ###########
+# input:
+#       - data_list: list of data to be interpolated (e.g. easting, northing, altitude of projected DEM points)
+#       - points: location of the point in the grid
+#       - shape: shape of the image (rows, cols)
+#       - out_dir: out_dir to store data
+#       - filenames: names of tif-files to store data (one for each data array)
+#       - interpolation_type: way to interpolate data: 'nearest': Nearest Neighbour; 'linear': Bilinear
+#       - cam_pos: camera position (easting, northing); if given, distance to camera is stored as dist_raster.tif
+#                  (first two data arrays have to be easting & northing)
+#       - strip_rows: number of rows interpolated at once
+#       - halo: initial number of rows above & below each strip, from which points are used for the interpolation
+#               (extended for each strip as far as needed, see interpolate_strip)
+#       - workers: number of processes (None: number of CPUs)
+#       - compress, cog: compression & Cloud-Optimized GeoTIFF layout of tif-files (see write_array_as_geotiff)
+# only the strips, which are processed or wait to be written, are kept in memory
+def interpolate_rasters_tiled(data_list, points, shape, out_dir, filenames, interpolation_type = 'nearest', cam_pos = None, 
+                              strip_rows = 512, halo = 64, workers = None, compress = 'DEFLATE', cog = False):
+    # import required libraries
+    from scipy.spatial import ConvexHull, QhullError
+    import multiprocessing, os
+    import numpy as np
+    
+    print('Interpolate rasters in strips of ' + str(strip_rows) + ' rows...')
+    rows, cols = shape
+    ##### sort points by row, so that points of a strip can be selected quickly
+    points = np.asarray(points, dtype=np.float64)
+    order = np.argsort(points[:,0], kind='stable')
+    points = points[order]
+    data_list = [np.asarray(data, dtype=np.float64)[order] for data in data_list]
+    # corners of convex hull of all points (pixels outside of it are not interpolated)
+    # (all points on one line: no pixel can be interpolated, strips stay empty)
+    hull_pts = None
+    if interpolation_type == 'linear':
+        try:
+            hull_pts = points[ConvexHull(points).vertices]
+        except QhullError:
+            pass
+    
+    ##### create tif-files
+    if cam_pos is not None:
+        filenames = list(filenames) + ['dist_raster.tif']
+    datasets = [create_geotiff(out_dir, filename, rows, cols, 'Float32', float('nan'), compress) for filename in filenames]
+    bands = [ds.GetRasterBand(1) for ds in datasets]
+    
+    ##### tasks: first & last row of strip
+    tasks = [(row_start, min(row_start+strip_rows, rows)) for row_start in range(0, rows, strip_rows)]
+    
+    ##### interpolate strips in parallel & write them in order into tif-files
+    with multiprocessing.Pool(workers, init_strip_worker, (points, data_list, hull_pts, cols, interpolation_type, cam_pos, halo)) as pool:
+        for task, result in zip(tasks, pool.imap(interpolate_strip, tasks)):
+            for band, strip in zip(bands, result):
+                band.WriteArray(strip, 0, task[0])
+    for band in bands:
+        band.FlushCache()
+    bands = None
+    datasets = None
+    
+    ##### convert to Cloud-Optimized GeoTIFFs
+    if cog:
+        for filename in filenames:
+            finish_geotiff(os.path.join(out_dir, filename), 'Float32', compress)
+#############################################################################################################
+
 
 
 ############### calculates distance of image pixel to closest projected DEM pixel (needed for mask layer) ###
@@ -132,36 +522,31 @@ def interpolate_raster(data, points, interpolation_grid, out_dir, filename, inte
 #       - points: location of the point in the grid
 #       - interpolation_grid: grid for which the distance to the closest point is calculated
 #       - out_dir: out_dir to store data
-def calculate_distance_raster(points, interpolation_grid, out_dir):
+#       - margin: points outside of the image are considered up to this distance (in pixels) from the image border
+#       - compress, cog: compression & Cloud-Optimized GeoTIFF layout of tif-file (see write_array_as_geotiff)
+def calculate_distance_raster(points, interpolation_grid, out_dir, margin = 64, compress = 'DEFLATE', cog = False):
     # import required libraries
     import numpy as np
-    from scipy.spatial.distance import cdist
+    from scipy import ndimage
     
     ##### calculate distance of pixel to next projected point, needed to detect skyline
-    #(very time consuming, maybe easier approach possible)
-    print('Calculate distance to projected points. Very time consuming... ')
-    # reference points to calculate point distance (dont use all of them to save time)
+    print('Calculate distance to projected points...')
     rows, cols = interpolation_grid[0].shape
-    ref_pts = list()
-    for row in range(0,rows, 4):
-        for col in range(0,cols, 4):
-            ref_pts.append((row, col)) 
-            
-    points_selected =list()
-    subset = int(max(len(points)/100000,1))
-    for x in range(0, len(points), subset):
-        points_selected.append(points[x])
-    
-    ##### calculate minimum distance to next projected point and append to one list
-    dist_info = list()
-    for i in range((int(len(ref_pts)/5000+1))):
-        dist_info.append(cdist(ref_pts[i*5000:min(i*5000+5000,len(ref_pts))],points_selected, 'euclidean').min(axis=1))
-    dist_pts_final = dist_info[0]
-    for array in dist_info[1:int((len(ref_pts)/5000+1))]:
-        dist_pts_final = np.append(np.array(dist_pts_final),np.array(array))
-       
-    ##### interpolate result to raster of image size and save it as tif-file    
-    dist_pts = interpolate_raster(np.array(dist_pts_final), np.array(ref_pts), interpolation_grid, out_dir, "aux_DEMptDist.tif", interpolation_type='nearest')
+    points = np.array(points, dtype=np.int64).reshape((-1,2))
+    
+    ##### rasterize projected points onto image grid (extended by margin for points outside of image)
+    points = points[(points[:,0]>=-margin) & (points[:,0]<rows+margin) & (points[:,1]>=-margin) & (points[:,1]<cols+margin)]
+    if len(points) == 0:
+        dist_pts = np.full((rows, cols), np.inf)
+    else:
+        no_point = np.ones((rows+2*margin, cols+2*margin), dtype=bool)
+        no_point[points[:,0]+margin, points[:,1]+margin] = False
+        
+        ##### exact euclidean distance of each pixel to closest point
+        dist_pts = ndimage.distance_transform_edt(no_point)[margin:margin+rows, margin:margin+cols]
+    
+    ##### save result as tif-file    
+    write_array_as_geotiff(dist_pts, out_dir, "aux_DEMptDist.tif", compress = compress, cog = cog)
     # return array with distance information to main procedure
     return dist_pts
 #############################################################################################################
@@ -171,30 +556,134 @@ def calculate_distance_raster(points, interpolation_grid, out_dir):
 ############### create mask layer to filter areas above skyline #############################################
 # input:
 #       - dist_pts_raster: array with information about distance to next projected DEM point
-#       - interpolation_grid: grid for which the distance to the closest point is calculated
 #       - out_dir: output directory to store data
-def create_mask(dist_pts_raster, out_dir):
+#       - threshold: maximum distance (in image pixels) to next DEM point, at which a pixel is not sky
+#       - compress, cog: compression & Cloud-Optimized GeoTIFF layout of tif-file (see write_array_as_geotiff)
+def create_mask(dist_pts_raster, out_dir, threshold = 9, compress = 'DEFLATE', cog = False):
     # import required libraries
     import numpy as np
     
     ##### generate mask from distance raster 
-    # (if distance to next DEM point less than 10 image pixels, all areas below are not sky)
+    # (from the first pixel in each column with distance to next DEM point of at most threshold, all areas below are not sky)
     print('Generate mask...')
-    mask = np.array(dist_pts_raster)
+    dist_pts_raster = np.asarray(dist_pts_raster)
     rows, cols = dist_pts_raster.shape
-    for col in range(0,cols):
-        row_lim = False
-        for row in range(0,rows):
-            if(row_lim):
-                mask[row,col]=1
-            elif(dist_pts_raster[row, col]>9):
-                mask[row,col]=0
-            else:
-                mask[row,col]=1
-                row_lim = True
-    
-    ##### export result to tif file
-    write_array_as_geotiff(mask, out_dir, "mask.tif")
+    below = ~(dist_pts_raster > threshold)
+    # first row below skyline in each column (rows, if there is none)
+    first_row = np.where(below.any(axis=0), np.argmax(below, axis=0), rows)
+    mask = (np.arange(rows)[:,None] >= first_row[None,:]).astype(dist_pts_raster.dtype)
+    
+    ##### export result to tif file (1 bit per pixel)
+    write_array_as_geotiff(mask, out_dir, "mask.tif", data_type = 'Byte', compress = compress, cog = cog, nbits = 1)
+#############################################################################################################
+
+
+
+############### derive skyline directly from projected DEM points ###########################################
+# input:
+#       - img_row, img_col: position in image of all projected DEM points
+#       - rows, cols: number of rows & columns of image
+#       - max_gap: maximum number of columns without DEM points, which are bridged by linear interpolation 
+#                  (None: all gaps are bridged)
+#       - smooth: size of median filter to smooth skyline profile (0: no smoothing)
+# returns top row of DEM points in each column (rows, if no DEM point is in this column)
+def calculate_skyline(img_row, img_col, rows, cols, max_gap = None, smooth = 0):
+    # import required libraries
+    import numpy as np
+    from scipy import ndimage
+    
+    print('Derive skyline from projected points...')
+    ##### top row of projected points in each column (points above image lie on first row)
+    row = np.asarray(img_row).astype(np.int64)
+    col = np.asarray(img_col).astype(np.int64)
+    inside = (col>=0) & (col<cols) & (row<rows)
+    skyline = np.full(cols, np.inf)
+    np.minimum.at(skyline, col[inside], np.maximum(row[inside], 0).astype(float))
+    
+    ##### bridge columns without points by linear interpolation between neighbouring columns
+    valid = np.flatnonzero(np.isfinite(skyline))
+    if len(valid) == 0:
+        return np.full(cols, float(rows))
+    gaps = np.flatnonzero(~np.isfinite(skyline))
+    if len(gaps):
+        bridged = np.interp(gaps, valid, skyline[valid])
+        if max_gap is not None:
+            # width of gap between closest columns with points (gaps at image border are not bridged)
+            right = np.searchsorted(valid, gaps)
+            left = right-1
+            width = np.where((left>=0) & (right<len(valid)), valid[np.minimum(right, len(valid)-1)]-valid[np.maximum(left, 0)]-1, np.inf)
+            bridged[width > max_gap] = rows
+        skyline[gaps] = bridged
+    
+    ##### smooth skyline profile
+    if smooth > 1:
+        skyline = ndimage.median_filter(skyline, size=int(smooth), mode='nearest')
+    # return skyline to main procedure
+    return skyline
+#############################################################################################################
+
+
+
+############### create mask layer from skyline ##############################################################
+# input:
+#       - skyline: top row of DEM points in each column (see calculate_skyline)
+#       - rows: number of rows of image
+#       - out_dir: output directory to store data
+#       - compress, cog: compression & Cloud-Optimized GeoTIFF layout of tif-file (see write_array_as_geotiff)
+def create_skyline_mask(skyline, rows, out_dir, compress = 'DEFLATE', cog = False):
+    # import required libraries
+    import numpy as np
+    
+    ##### all pixels on or below skyline are not sky
+    print('Generate mask...')
+    mask = (np.arange(rows)[:,None] >= np.ceil(skyline)[None,:]).astype(np.float64)
+    
+    ##### export result to tif file (1 bit per pixel)
+    write_array_as_geotiff(mask, out_dir, "mask.tif", data_type = 'Byte', compress = compress, cog = cog, nbits = 1)
+#############################################################################################################
+
+
+
+############### store skyline as polyline (shp) & json-file #################################################
+# input:
+#       - skyline: top row of DEM points in each column (see calculate_skyline)
+#       - rows: number of rows of image
+#       - out_dir: output directory to store data
+# polyline is stored in image coordinates (x: column, y: -row), like shp-files projected to image plane;
+# json-file contains skyline row of each column (null, if there is no DEM point in this column)
+def export_skyline(skyline, rows, out_dir):
+    # import required libraries
+    import osgeo.ogr as ogr
+    import numpy as np
+    import os, json
+    
+    ##### store skyline of each column in json-file
+    valid = skyline < rows
+    with open(os.path.join(out_dir, 'skyline.json'), 'w') as f:
+        json.dump([float(r) if v else None for r, v in zip(skyline, valid)], f)
+    
+    ##### create polyline; columns without DEM points split skyline into several lines
+    line = ogr.Geometry(ogr.wkbMultiLineString)
+    starts = np.flatnonzero(valid & ~np.concatenate(([False], valid[:-1])))
+    ends = np.flatnonzero(valid & ~np.concatenate((valid[1:], [False])))
+    for start, end in zip(starts, ends):
+        part = ogr.Geometry(ogr.wkbLineString)
+        for col in range(start, end+1):
+            part.AddPoint_2D(float(col), -float(skyline[col]))
+        line.AddGeometry(part)
+    
+    ##### store polyline as shp-file
+    driver = ogr.GetDriverByName("ESRI Shapefile")
+    shp_file = os.path.join(out_dir, 'skyline.shp')
+    if os.path.exists(shp_file):
+        driver.DeleteDataSource(shp_file)
+    data_source = driver.CreateDataSource(shp_file)
+    layer = data_source.CreateLayer("skyline", None, ogr.wkbMultiLineString)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(line)
+    layer.CreateFeature(feature)
+    feature = None
+    data_source = None
 #############################################################################################################
 
 
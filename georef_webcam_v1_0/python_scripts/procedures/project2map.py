@@ -3,7 +3,7 @@
 """
 #############################################################################################################
 Created on Wed Oct 30 2019
-Last edited on Fri Feb 11 2022
+Last edited on Sun Oct 18 2026
 
 Author: Sebastian Buchelt
 
@@ -27,6 +27,8 @@ Author: Sebastian Buchelt
 %
 %   Overview:   project_tif: projects tif in image projection to map 
 %                       coordinates
+%               project_tif_stack: projects several tifs in one vectorized
+%                       pass into a single multi-band map
 %               project_image: converts image data in other formats to tif and 
 %                       then calls the project_tif function
 %               project_to_image_plane: projects geotifs, which are in the same 
@@ -49,12 +51,23 @@ Author: Sebastian Buchelt
 #       - out_dir: output directory where projected maps are stored
 #       - fill_nodata: boolean; if True, gaps in projected map are filled by interpolation
 #       - file: boolean; set True, if only a single file is projected
+#       - workers: number of processes used to project the files of image_folder in parallel
+#       - compress: compression of projected maps ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - cog: boolean; if True, projected maps are stored as Cloud-Optimized GeoTIFFs with overviews
+#       - out_dtype: name of GDAL data type of projected maps (e.g. 'Byte', 'Float32'); if None, data type of input is kept
+#       - round_values: boolean; if True, mean values are rounded for integer output; otherwise truncated
+#       - method: aggregation of image pixels assigned to a map pixel: 'mean', 'median', 'min', 'max', 'std' or 'mode'
+#       - count_band: boolean; if True, an additional band with the number of image pixels per map pixel is stored
+#       - resampling: 'push': image pixels are assigned to the map pixel they fall in
+#                     'nearest'/'idw': map pixels get value of nearest/inverse distance weighted k nearest image pixels
+#       - k: number of nearest image pixels used with resampling 'idw'
+#       - max_radius: maximum distance (in map units) between map pixel and image pixel with resampling 'nearest'/'idw'
 ###############################################################################
-def project_tif(coord_dir, px_size, pj_file, image_folder, out_dir, fill_nodata=False, file=False):
+def project_tif(coord_dir, px_size, pj_file, image_folder, out_dir, fill_nodata=False, file=False, workers=1, compress='DEFLATE', cog=False, out_dtype=None, round_values=True, 
+                method='mean', count_band=False, resampling='push', k=4, max_radius=None):
     # import required libraries
-    from osgeo.gdalconst import GA_ReadOnly
-    import os, gdal, sys, math, subprocess, platform
-    import numpy as np
+    import os
+    import modules.aux_project2map as aux_proj
     
     ##### get list of the images from image folder directory 
     if file:
@@ -68,113 +81,156 @@ def project_tif(coord_dir, px_size, pj_file, image_folder, out_dir, fill_nodata=
         os.makedirs(out_dir)
     
     
-    ##### open & read coordinate raster and mask layers
-    driver = gdal.GetDriverByName('GTiff')
-    driver.Register()
-    input_list = ['mask.tif', 'north_raster.tif', 'east_raster.tif']
-    for i in input_list:
-    	datafile = os.path.join(coord_dir, i)
-    	inDs = gdal.Open(datafile, GA_ReadOnly)
-    	if inDs is None:
-             print ('could not open ' + datafile)
-             sys.exit(1)
-    	canal = inDs.GetRasterBand(1)
-    	if (i == 'mask.tif'):
-             mask = canal.ReadAsArray().astype(np.float)
-             cols = inDs.RasterXSize
-             rows = inDs.RasterYSize
-    	elif (i == 'north_raster.tif'):
-    		north = canal.ReadAsArray().astype(np.float)
-    	elif (i == 'east_raster.tif'):
-    		east = canal.ReadAsArray().astype(np.float)
+    ##### load lookup table between image and map pixels
+    # (calculated once for each set of coordinate rasters & pixel size and then read from cache)
+    lut = aux_proj.get_lut(coord_dir, px_size)
+    # sparse matrix, which projects image to map pixels (forward or inverse resampling)
+    operator = aux_proj.get_operator(coord_dir, lut, resampling, k, max_radius)
     
-    ####################### derive extent of map array  #######################
-    ##### mask georeferencing layers
-    north[mask==0] = np.nan
-    east[mask==0] = np.nan
-    
-    ##### get maximum spatial extent uf remaining image area in world coordinate system
-    min_max_east = (np.nanmin(east), np.nanmax(east))
-    min_max_north = (np.nanmin(north), np.nanmax(north))
+    ################# project each tif file to map ############################
+    ##### in parallel: lookup table is placed once in shared memory for all worker processes
+    if workers > 1 and len(img_file_list) > 1:
+        aux_proj.project_files_parallel(img_file_list, operator, lut, pj_file, out_dir, fill_nodata, compress, cog, out_dtype, round_values, method, count_band, workers)
+    ##### or one after another
+    else:
+        for img_file in img_file_list:
+            aux_proj.project_file(img_file, operator, lut, pj_file, out_dir, fill_nodata, compress, cog, out_dtype, round_values, method, count_band)
+   
+################################### end #######################################
+###############################################################################
+        
+        
+
+###############################################################################
+###### function to project a time series of tifs into one multi-band map ######
+# input:
+#       - coord_dir: directory to mask and coordinate raster layers
+#       - px_size: spatial resolution of projected map
+#       - pj_file: file which contains CRS information
+#       - image_folder: directory, where images that should be projected are stored
+#       - out_dir: output directory where projected map stack is stored
+#       - stack_name: name of the multi-band tif-file, in which all projected frames are stored
+#       - batch_size: number of frames, which are read & projected in one vectorized pass (None: derived from batch_bytes)
+#       - batch_bytes: approximate memory (in bytes) used by the values & no-Data mask of one batch, if batch_size is None
+#       - compress: compression of projected map stack ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - cog: boolean; if True, projected map stack is stored as Cloud-Optimized GeoTIFF with overviews
+#       - out_dtype: name of GDAL data type of projected map stack (e.g. 'Byte', 'Float32'); if None, data type of input is kept
+#       - round_values: boolean; if True, mean values are rounded for integer output; otherwise truncated
+#       - method: aggregation of image pixels assigned to a map pixel: 'mean', 'median', 'min', 'max', 'std' or 'mode'
+#       - resampling: 'push': image pixels are assigned to the map pixel they fall in
+#                     'nearest'/'idw': map pixels get value of nearest/inverse distance weighted k nearest image pixels
+#       - k: number of nearest image pixels used with resampling 'idw'
+#       - max_radius: maximum distance (in map units) between map pixel and image pixel with resampling 'nearest'/'idw'
+#       - block_pixels: approximate number of values (map pixels x frames of batch), which are projected & written at once
+###############################################################################
+def project_tif_stack(coord_dir, px_size, pj_file, image_folder, out_dir, stack_name='stack_map.tif', batch_size=None, batch_bytes=2**30, compress='DEFLATE', cog=False, out_dtype=None, round_values=True, 
+                      method='mean', resampling='push', k=4, max_radius=None, block_pixels=2**22):
+    # import required libraries
+    from osgeo.gdalconst import GA_ReadOnly
+    from osgeo import gdal_array
+    import os, gdal
+    import numpy as np
+    import modules.aux_functions as aux_func
+    import modules.aux_project2map as aux_proj
     
-    ##### correct extent values, so that whole extent is covered & extent is divideable by pixel_size
-    half_px = px_size/2
-    min_max_east = (round(min_max_east[0]/px_size)*px_size-half_px, round(min_max_east[1]/px_size)*px_size+half_px)
-    min_max_north = (round(min_max_north[0]/px_size)*px_size-half_px, round(min_max_north[1]/px_size)*px_size+half_px)
+    ##### get list of the images from image folder directory 
+    img_file_list = [os.path.join(image_folder, f) for f in os.listdir(image_folder) if (f.endswith('.tif'))]
+    img_file_list.sort()
     
-    ##### get number of rows & cols of projected map
-    row_number = int((min_max_north[1]-min_max_north[0])/px_size)
-    col_number = int((min_max_east[1]-min_max_east[0])/px_size)
+    ##### create directory, where output should be stored
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
     
+    ##### load lookup table between image and map pixels & create projection operator
+    lut = aux_proj.get_lut(coord_dir, px_size)
+    operator = aux_proj.get_operator(coord_dir, lut, resampling, k, max_radius)
+    row_number, col_number = [int(x) for x in lut['map_shape']]
     
-    ################ calculate for each image pixel the #######################
-    ############## correlating position in the new array ######################
-    pos_new = np.ones((rows,cols,2))*-1
-    for col in range(cols):
-        for row in range(rows):
-            if not (math.isnan(east[row,col])) and not (math.isnan(north[row,col])):
-                pos_new[row,col] = [int((east[row,col]-min_max_east[0])/px_size), int((north[row,col]-min_max_north[0])/px_size)]
+    ##### create one tif-file for all projected frames 
+    # (all frames need to have the same number of bands as the first one)
+    # (data type & no-Data-value are defined by the first band of the first frame)
+    # (bands are stored separately, so that tiles written by one batch are not rewritten by the next one)
+    inDs = gdal.Open(img_file_list[0], GA_ReadOnly)
+    no_of_bands = inDs.RasterCount
+    gdal_type, np_dtype, out_noData, predictor = aux_proj.output_datatype(inDs.GetRasterBand(1).DataType, out_dtype, inDs.GetRasterBand(1).GetNoDataValue())
+    # data type of values in memory (float32 for data with up to 16 bit, see mask_nodata)
+    val_dtype = np.result_type(gdal_array.GDALTypeCodeToNumericTypeCode(inDs.GetRasterBand(1).DataType), np.float32)
+    if batch_size is None:
+        # (values & no-Data mask of all bands of a frame)
+        batch_size = max(1, int(batch_bytes // (inDs.RasterXSize*inDs.RasterYSize*no_of_bands*(val_dtype.itemsize+1))))
+    inDs = None
+    dst_ds = gdal.GetDriverByName('GTiff').Create(os.path.join(out_dir,stack_name), col_number, row_number, no_of_bands*len(img_file_list), gdal_type, 
+                                                  options = aux_func.geotiff_options(compress, predictor) + ['INTERLEAVE=BAND'])
+    dst_ds.SetGeoTransform(tuple(lut['geotransform']))
+    dst_ds.SetProjection(pj_file)
+    # output without no-Data-value: pixel is valid, if it is valid in any frame
+    mask_band = aux_proj.create_mask_band(dst_ds) if out_noData is None else None
+    if mask_band is not None:
+        stack_valid = np.zeros(row_number*col_number, dtype=bool)
     
-    ################# read tif data which should be projected #################
-    for img_file in img_file_list:
-        inDs = gdal.Open(img_file, GA_ReadOnly)
-        no_of_bands = inDs.RasterCount
-        
-        ##### create tif-file for projected result
-        img_name = os.path.basename(img_file)               # get image name
-        tif_name = img_name.split('.')[0]+'_map.tif'         # create output map name from that
-        dst_ds = gdal.GetDriverByName('GTiff').Create(os.path.join(out_dir,tif_name), col_number, row_number, no_of_bands, gdal.GDT_Float64)     # create the single band raster tif-file
+    ############### read & project frames batch-wise ##########################
+    for start in range(0, len(img_file_list), batch_size):
+        batch_files = img_file_list[start:start+batch_size]
+        ##### read all bands of all frames directly into one (pixels, frames*bands) float array
+        stack = None
+        noDataVals = list()
+        for j, img_file in enumerate(batch_files):
+            inDs = gdal.Open(img_file, GA_ReadOnly)
+            if not inDs.RasterCount == no_of_bands:
+                print('Error: ' + os.path.basename(img_file) + ' has ' + str(inDs.RasterCount) + ' instead of ' + str(no_of_bands) + ' bands')
+                dst_ds = None
+                return
+            frame = inDs.ReadAsArray().reshape((no_of_bands, -1))
+            if stack is None:
+                stack = np.empty((frame.shape[1], no_of_bands*len(batch_files)), dtype=val_dtype)
+            stack[:, j*no_of_bands:(j+1)*no_of_bands] = frame.T
+            # undefined no-Data-values are replaced by nan, so that no pixel is excluded
+            noDataVals += [np.nan if inDs.GetRasterBand(b+1).GetNoDataValue() is None else inDs.GetRasterBand(b+1).GetNoDataValue() for b in range(no_of_bands)]
+            inDs = None
+            del frame
+        # (no-Data pixels are set to 0 in place)
+        masked = aux_proj.mask_nodata(stack, np.array(noDataVals))
+        del stack
         
-    #################### run projection for each band #########################
-        for i in range(no_of_bands):
-            ##### open classified image
-            canal = inDs.GetRasterBand(i+1)
-            noDataVal = canal.GetNoDataValue()
-            image = canal.ReadAsArray()
-            
-            ##### create output arrays
-            count_array = np.zeros((row_number, col_number))        # counts the number of image pixels assigned to each map pixel
-            snow_val = np.full((row_number, col_number), -9999)     # output array for map 
-            
-            ##### assign image values to map pixels
-            for col in range(cols):
-                for row in range(rows):
-                    if not (image[row, col]==noDataVal):                              # exclude no-Data pixels
-                        if not -1 in pos_new[row,col]:
-                            east_pos = int(pos_new[row,col,0])                  # get easting position in map array
-                            north_pos = int(pos_new[row,col,1])+1               # get northing position in map array
-                            # value assignment: (value*no_of_already_assigned_values + new_value_to_be_added)/new_number_of_assigned_values
-                            snow_val[row_number-north_pos, east_pos] = (snow_val[row_number-north_pos, east_pos]*count_array[row_number-north_pos,east_pos]+image[row, col])/(count_array[row_number-north_pos,east_pos]+1)
-                            count_array[row_number-north_pos,east_pos] +=1      # increase counter for this pixel by 1
-            snow_val[count_array==0]=-9999                                      # assign noData-value, if no value was assigned before
-            
-            ##### write output to tif-file   
-            dst_ds.GetRasterBand(i+1).WriteArray(snow_val)        # write result array into tif-file
-            dst_ds.GetRasterBand(i+1).SetNoDataValue(-9999)       # define no-Data-value to -9999
-        
-    ########## define geotransformation & projection and save result ##########
-        geotransform = (min_max_east[0], px_size, 0, min_max_north[1], 0, -px_size)     # geotransformation from spatial extent and pixel size
-        dst_ds.SetGeoTransform(geotransform)                                            # set geotransfornation to tif-file
+        ##### project all frames block by block with one sparse matrix product (or aggregate them with group-by kernels)
+        # (block height is a multiple of the tile size, so that peak memory depends neither on map size nor on batch size)
+        block_rows = max(256, int(block_pixels/(col_number*len(batch_files)))//256*256)
+        for row_start in range(0, row_number, block_rows):
+            row_end = min(row_start+block_rows, row_number)
+            block_operator = operator[row_start*col_number:row_end*col_number]
+            if method == 'mean':
+                map_stack, count_array = aux_proj.project_stack(block_operator, None, masked = masked)
+            else:
+                map_stack, count_array = aux_proj.aggregate_groups(block_operator, masked, method)
+            if mask_band is not None:
+                stack_valid[row_start*col_number:row_end*col_number] |= ((count_array>0) & ~np.isnan(map_stack)).any(axis=1)
+            map_stack = aux_proj.convert_datatype(map_stack, count_array, np_dtype, out_noData, round_values)
+            ##### write block of projected frames into their bands
+            for j in range(len(batch_files)):
+                for b in range(no_of_bands):
+                    dst_ds.GetRasterBand((start+j)*no_of_bands+b+1).WriteArray(map_stack[:,j*no_of_bands+b].reshape((row_end-row_start, col_number)), 0, row_start)
+            del map_stack, count_array, block_operator
+        del masked
         
-        # get & define projection from DEM file and save result
-        dst_ds.SetProjection(pj_file)      # set projection to tif-file
-        dst_ds.FlushCache()                     # write to disk
-        dst_ds = None                           # save, close     
-        canal = None
-        inDs = None
+        ##### define no-Data-value & names of bands of projected frames
+        for j, img_file in enumerate(batch_files):
+            img_name = os.path.basename(img_file)
+            for b in range(no_of_bands):
+                dst_band = dst_ds.GetRasterBand((start+j)*no_of_bands+b+1)
+                if mask_band is None:
+                    dst_band.SetNoDataValue(out_noData)
+                dst_band.SetDescription(img_name.split('.')[0] + '_b' + str(b+1))      # frame and band name
+                dst_band.SetMetadata({'FRAME': img_name, 'FRAME_INDEX': str(start+j), 'BAND': str(b+1)})
+            print (img_name + ' is processed')
     
-    ######## optionnal: fill noData-gaps with small scale interpolation #######
-    ############## using the gdal function gdal_fillnodata.py #################
-    # value of fill_nodata decides to what pixel range the interpolation is applied 
-        if(fill_nodata):
-            for i in range(no_of_bands):
-                if(platform.system()=='Windows'):
-                    subprocess.Popen("gdal_fillnodata.py -md "+str(fill_nodata)+" "+os.path.join(out_dir,tif_name)+" -b " +str(i+1), shell = True,stdout=subprocess.PIPE)
-                else:
-                    subprocess.Popen(['gdal_fillnodata.py', '-md', str(fill_nodata), os.path.join(out_dir,tif_name), '-b', str(i+1)],stdout=subprocess.PIPE)
-            
-        print (img_name + ' is processed')      # print to console, that processing of file x is finished
-   
+    ##### save result
+    if mask_band is not None:
+        aux_proj.write_mask(mask_band, stack_valid, (row_number, col_number))
+        mask_band = None
+    dst_ds.FlushCache()                     # write to disk
+    dst_ds = None                           # save, close
+    if cog:
+        aux_func.convert_to_cog(os.path.join(out_dir,stack_name), compress, predictor)
 ################################### end #######################################
 ###############################################################################
         
@@ -192,10 +248,24 @@ def project_tif(coord_dir, px_size, pj_file, image_folder, out_dir, fill_nodata=
 #       - out_dir: output directory where projected maps are stored
 #       - fill_nodata: boolean; if True, gaps in projected map are filled by interpolation
 #       - data: boolean; set True, if you want to read png files via external function
+#       - stack: boolean; if True, all images are projected into a single multi-band tif (see project_tif_stack)
+#       - workers: number of processes used to project the converted images in parallel
+#       - compress: compression of projected maps ('DEFLATE', 'ZSTD', 'LZW' or 'NONE')
+#       - cog: boolean; if True, projected maps are stored as Cloud-Optimized GeoTIFFs with overviews
+#       - out_dtype: name of GDAL data type of projected maps (e.g. 'Byte', 'Float32'); if None, data type of image is kept
+#       - round_values: boolean; if True, mean values are rounded for integer output; otherwise truncated
+#       - method: aggregation of image pixels assigned to a map pixel: 'mean', 'median', 'min', 'max', 'std' or 'mode'
+#       - count_band: boolean; if True, an additional band with the number of image pixels per map pixel is stored
+#       - resampling: 'push': image pixels are assigned to the map pixel they fall in
+#                     'nearest'/'idw': map pixels get value of nearest/inverse distance weighted k nearest image pixels
+#       - k: number of nearest image pixels used with resampling 'idw'
+#       - max_radius: maximum distance (in map units) between map pixel and image pixel with resampling 'nearest'/'idw'
 ###############################################################################
-def project_image(coord_dir, px_size, pj_file, image_folder=None, file_ending=None, image_file = None, out_dir=None, fill_nodata=False, data=False):
+def project_image(coord_dir, px_size, pj_file, image_folder=None, file_ending=None, image_file = None, out_dir=None, fill_nodata=False, data=False, stack=False, workers=1, compress='DEFLATE', cog=False, out_dtype=None, round_values=True, 
+                  method='mean', count_band=False, resampling='push', k=4, max_radius=None):
     # import required libraries and submodules of georef_webcam
     import os, gdal
+    from osgeo import gdal_array
     from PIL import Image
     import numpy as np
     import modules.aux_results as aux_res
@@ -233,8 +303,11 @@ def project_image(coord_dir, px_size, pj_file, image_folder=None, file_ending=No
         else:
         	im1 =  Image.open(img_file)
         	image = np.array(im1)
+        if image.ndim == 2:                     # single band images (e.g. grayscale)
+            image = image[:,:,np.newaxis]
         row_number, col_number, no_of_bands = image.shape
-        dst_ds = gdal.GetDriverByName('GTiff').Create(tif_file, col_number, row_number, no_of_bands, gdal.GDT_Float64)   # create the 3-band raster tif-file
+        # create the 3-band raster tif-file with the data type of the image
+        dst_ds = gdal.GetDriverByName('GTiff').Create(tif_file, col_number, row_number, no_of_bands, gdal_array.NumericTypeCodeToGDALTypeCode(image.dtype))
         for i in range(no_of_bands):
             dst_ds.GetRasterBand(i+1).WriteArray(image[:,:,i])      # write image band to the raster
             
@@ -242,7 +315,17 @@ def project_image(coord_dir, px_size, pj_file, image_folder=None, file_ending=No
         dst_ds = None                           # save, close     
         
     ############### execute projection and delete intermediate tifs ###########
-        project_tif(coord_dir, px_size, pj_file, tif_file, out_dir, fill_nodata=fill_nodata, file=True)
+    ##### project all converted images at once into a single multi-band tif
+    if stack:
+        project_tif_stack(coord_dir, px_size, pj_file, tif_dir, out_dir, compress=compress, cog=cog, out_dtype=out_dtype, round_values=round_values, method=method, 
+                          resampling=resampling, k=k, max_radius=max_radius)
+    ##### or project all converted images with one call (lookup table & operator are loaded once, files are processed by the workers)
+    else:
+        single = len(img_file_list) == 1
+        project_tif(coord_dir, px_size, pj_file, tif_file if single else tif_dir, out_dir, fill_nodata=fill_nodata, file=single, workers=workers, compress=compress, cog=cog, 
+                    out_dtype=out_dtype, round_values=round_values, method=method, count_band=count_band, resampling=resampling, k=k, max_radius=max_radius)
+    for img_file in img_file_list:
+        tif_file = os.path.join(tif_dir,os.path.splitext(os.path.basename(img_file))[0]+'.tif')
         if os.path.isfile(tif_file):
             os.remove(tif_file)
     if os.path.exists(tif_dir):
@@ -260,12 +343,19 @@ def project_image(coord_dir, px_size, pj_file, image_folder=None, file_ending=No
 #       - image_folder: directory, where images that should be projected are stored
 #       - out_dir: output directory where projected maps are stored
 #       - file: boolean; set True, if only a single file is projected
+#       - out_dtype: name of GDAL data type of output (e.g. 'Byte', 'Float32'); if None, data type of input is kept
+#       - resampling: kernel used to sample the geotifs ('nearest', 'bilinear' or 'cubic')
+#       - stack: boolean; set True, if all geotifs should be stored as bands of a single tif-file
+#       - stack_name: name of multi-band tif-file
 ###############################################################################
-def project_to_image_plane(coord_dir, image_folder, out_dir, file=False):
+def project_to_image_plane(coord_dir, image_folder, out_dir, file=False, out_dtype=None, resampling='nearest', 
+                           stack=False, stack_name='stack_projected.tif'):
     # import required libraries
     from osgeo.gdalconst import GA_ReadOnly
-    import os, gdal, sys, struct
+    import os, gdal, sys
     import numpy as np
+    import modules.aux_project2map as aux_proj
+    import modules.aux_functions as aux_func
     
     ##### get list of the images from image folder directory 
     if file:
@@ -282,26 +372,40 @@ def project_to_image_plane(coord_dir, image_folder, out_dir, file=False):
     ##### open & read coordinate raster and mask layers
     driver = gdal.GetDriverByName('GTiff')
     driver.Register()
-    input_list = ['mask.tif', 'north_raster.tif', 'east_raster.tif']
-    for i in input_list:
-    	datafile = os.path.join(coord_dir, i)
-    	inDs = gdal.Open(datafile, GA_ReadOnly)
-    	if inDs is None:
-             print ('could not open ' + datafile)
-             sys.exit(1)
-    	canal = inDs.GetRasterBand(1)
-    	if (i == 'mask.tif'):
-             mask = canal.ReadAsArray().astype(np.float)
-             cols = inDs.RasterXSize
-             rows = inDs.RasterYSize
-    	elif (i == 'north_raster.tif'):
-    		north = canal.ReadAsArray().astype(np.float)
-    	elif (i == 'east_raster.tif'):
-    		east = canal.ReadAsArray().astype(np.float)
+    rasters = aux_proj.read_coordinate_rasters(coord_dir)
+    mask, north, east = rasters['mask'], rasters['north_raster'], rasters['east_raster']
+    rows, cols = mask.shape
+    coord_key = aux_proj.hash_coordinate_rasters(coord_dir)
+    
+    if resampling not in ['nearest', 'bilinear', 'cubic']:
+        print('Error: unknown resampling kernel ' + str(resampling))
+        sys.exit(1)
+    
+    ##### select all image pixels inside mask with valid coordinates (flat index in image array)
+    img_px = np.flatnonzero(~(mask==0) & ~np.isnan(mask) & ~np.isnan(east) & ~np.isnan(north))
+    east = east.ravel()[img_px]
+    north = north.ravel()[img_px]
+    
+    ##### create multi-band tif-file for all geotifs (data type & no-Data-value of first geotif)
+    if stack:
+        band_counts = []
+        for img_file in img_file_list:
+            inDs = gdal.Open(img_file, GA_ReadOnly)
+            band_counts.append(inDs.RasterCount)
+            if len(band_counts) == 1:
+                gdal_type, np_dtype, out_noData, predictor = aux_proj.output_datatype(inDs.GetRasterBand(1).DataType, out_dtype, 
+                                                                                     inDs.GetRasterBand(1).GetNoDataValue())
+            inDs = None
+        resDs = driver.Create(os.path.join(out_dir, stack_name), cols, rows, sum(band_counts), gdal_type, 
+                              options = aux_func.geotiff_options('DEFLATE', predictor))
+        # output without no-Data-value: pixel is valid, if it is valid in any geotif
+        mask_band = aux_proj.create_mask_band(resDs) if out_noData is None else None
+        stack_valid = np.zeros(rows*cols, dtype=bool)
+        band_offset = 0
     
     
     ############### read tif data which should be projected ###################
-    for img_file in img_file_list:
+    for frame, img_file in enumerate(img_file_list):
         inDs = gdal.Open(img_file, GA_ReadOnly)
         raster_col = inDs.RasterXSize
         raster_row = inDs.RasterYSize
@@ -311,42 +415,65 @@ def project_to_image_plane(coord_dir, image_folder, out_dir, file=False):
         
         ##### create tif-file for projected result
         img_name = os.path.basename(img_file)               # get image name
-        tif_name = img_name.split('.')[0]+'_projected.tif'         # create output map name from that
-        resDs = driver.Create(os.path.join(out_dir, tif_name), cols, rows, no_of_bands, gdal.GDT_Float64)
+        noDataVal = inDs.GetRasterBand(1).GetNoDataValue()
+        if not stack:
+            tif_name = img_name.split('.')[0]+'_projected.tif'         # create output map name from that
+            # keep data type of input or convert to selected output data type
+            gdal_type, np_dtype, out_noData, predictor = aux_proj.output_datatype(inDs.GetRasterBand(1).DataType, out_dtype, noDataVal)
+            resDs = driver.Create(os.path.join(out_dir, tif_name), cols, rows, no_of_bands, gdal_type)
+            mask_band = aux_proj.create_mask_band(resDs) if out_noData is None else None
         
     ############### run projection ############################################
-        sat_proj = np.zeros((rows,cols,no_of_bands))
-        for row in range(0,rows):
-            for col in range(0,cols):
-                if mask[row,col] and not any([np.isnan(mask[row,col]),np.isnan(east[row,col]), np.isnan(north[row,col])]):
-                    ##### identify corresponding map pixel for specific image pixel
-                    mx = east[row,col]
-                    my = north[row,col]
-                    px = int(round((mx - gt[0]) / gt[1])) #x pixel position in raster
-                    py = int(round((my - gt[3]) / gt[5])) #y pixel position in raster
-                    
-                    ##### extract data from each band & store it in array
-                    if(px>=0 and px<raster_col and py>=0 and py<raster_row):
-                        for b in range(no_of_bands):                
-                            ##### open classified image
-                            canal = inDs.GetRasterBand(b+1)                
-                            data = canal.ReadRaster(px,py,1,1,buf_type=gdal.GDT_UInt16) #Assumes 16 bit int aka 'short'
-                            sat_proj[row,col,b] = struct.unpack('h' , data)[0]
-                    
-                    ##### set undefined pixels and pixels outside extent to noDAtaValue
-                    else:
-                        sat_proj[row,col] = -9999
-                else:
-                    sat_proj[row,col] = -9999
+        ##### get corresponding map pixel of all image pixels (computed once for geotifs on the same grid)
+        index = aux_proj.get_image_index(coord_key, img_px, east, north, gt, (raster_row, raster_col))
+        
+        ##### set undefined pixels and pixels outside extent to noDataValue
+        sat_proj = np.full((no_of_bands, rows*cols), 0 if out_noData is None else out_noData, dtype=np_dtype)
+        proj_valid = np.zeros(rows*cols, dtype=bool)
+        
+        ##### read only window covering the camera footprint (all bands at once) & extract data with fancy indexing
+        if index['window'] is not None:
+            xoff, yoff, xsize, ysize = index['window']
+            data = inDs.ReadAsArray(xoff, yoff, xsize, ysize).reshape((no_of_bands, ysize, xsize))
+            if resampling == 'nearest':
+                values = data[:, index['rows'], index['cols']].astype(np.float64)
+                valid = ~(values==noDataVal) if noDataVal is not None else np.ones(values.shape, dtype=bool)
+                # round & clip values to output data type (values equal to the output no-Data-value are clipped)
+                values = aux_proj.convert_datatype(values, valid, np_dtype, out_noData)
+            ##### interpolate values at fractional positions (kernels touching no-Data pixels are set to no-Data)
+            else:
+                values, valid = aux_proj.sample_window(data, index['rows_pos'], index['cols_pos'], resampling, noDataVal)
+                values = aux_proj.convert_datatype(values, valid, np_dtype, out_noData)
+            del data
+            sat_proj[:, index['img_px']] = values
+            proj_valid[index['img_px']] = valid.any(axis=0)
                     
         ##### save results as tif file
         for b in range(no_of_bands):                
-            resBand = resDs.GetRasterBand(b+1)
-            resBand.WriteArray(sat_proj[:,:,b])
-            resBand.SetNoDataValue(-9999)       # define no-Data-value to -9999
+            if stack:
+                resBand = resDs.GetRasterBand(band_offset+b+1)
+                resBand.SetDescription(img_name.split('.')[0] + '_b' + str(b+1))      # file and band name
+                resBand.SetMetadata({'FRAME': img_name, 'FRAME_INDEX': str(frame), 'BAND': str(b+1)})
+            else:
+                resBand = resDs.GetRasterBand(b+1)
+            resBand.WriteArray(sat_proj[b].reshape((rows, cols)))
+            if mask_band is None:
+                resBand.SetNoDataValue(out_noData)       # define no-Data-value
             resBand.FlushCache()
             resBand = None
-        resDs = None
+        if stack:
+            band_offset += no_of_bands
+            stack_valid |= proj_valid
+        else:
+            if mask_band is not None:
+                aux_proj.write_mask(mask_band, proj_valid, (rows, cols))
+            mask_band = None
+            resDs = None
+        inDs = None
+    if stack and mask_band is not None:
+        aux_proj.write_mask(mask_band, stack_valid, (rows, cols))
+    mask_band = None
+    resDs = None
 ################################### end #######################################
 ###############################################################################
         
@@ -362,65 +489,82 @@ def project_to_image_plane(coord_dir, image_folder, out_dir, file=False):
 #       - file: boolean; set True, if only a single file is projected
 #       - to_map: boolean; if True, shp is projected from image view to map
 #                          if False, shp is projected from map to image view
+#       - max_distance: maximum distance (in map units) between a vertex and the nearest image pixel (only to image view);
+#                       vertices further away are outside the camera view and set to NaN
+#       - batch_size: number of features, whose vertices are projected at once & which are written in one transaction
+#       - out_format: format of output: 'shp' (ESRI Shapefile), 'gpkg' (GeoPackage) or 'fgb' (FlatGeobuf)
+#       - footprint_filter: boolean; if True, only features intersecting the camera footprint are projected (only to image view)
 ###############################################################################
-def project_geometry(coord_dir, pj_file, image_folder, out_dir, file=False, to_image_view=True):
+def project_geometry(coord_dir, pj_file, image_folder, out_dir, file=False, to_image_view=True, max_distance=None, batch_size=10000, 
+                     out_format='shp', footprint_filter=True):
     # import required libraries
     import osgeo.ogr as ogr
     import osgeo.osr as osr
-    import os, gdal, sys
-    import numpy as np
-    from osgeo.gdalconst import GA_ReadOnly
+    import os, sys
+    import modules.aux_project2map as aux_proj
 
     ##### get list of the images from image folder directory 
     if file:
         img_file_list = [image_folder]
     else:
-        img_file_list = [os.path.join(image_folder, f) for f in os.listdir(image_folder) if (f.endswith('.shp'))]
+        img_file_list = [os.path.join(image_folder, f) for f in os.listdir(image_folder) if (f.endswith(('.shp', '.gpkg', '.fgb')))]
         img_file_list.sort()
     
     ##### create directory, where output should be stored
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    ##### open & read coordinate raster and mask layers
-    driver = gdal.GetDriverByName('GTiff')
-    driver.Register()
-    input_list = ['north_raster.tif', 'east_raster.tif']
-    for i in input_list:
-    	datafile = os.path.join(coord_dir, i)
-    	inDs = gdal.Open(datafile, GA_ReadOnly)
-    	if inDs is None:
-             print ('could not open ' + datafile)
-             sys.exit(1)
-    	canal = inDs.GetRasterBand(1)
-    	if (i == 'north_raster.tif'):
-    		north = canal.ReadAsArray().astype(np.float)
-    	elif (i == 'east_raster.tif'):
-    		east = canal.ReadAsArray().astype(np.float)
+    ##### open & read coordinate raster layers
+    rasters = aux_proj.read_coordinate_rasters(coord_dir, ['north_raster.tif', 'east_raster.tif'])
+    coords = {'east': rasters['east_raster'], 'north': rasters['north_raster']}
                 
     ##### get prj data for projection procedure
     if to_image_view:    
+        # KD-tree over map coordinates of all image pixels (built once)
+        coords['tree'], coords['tree_px'] = aux_proj.get_coordinate_tree(coord_dir, use_mask=False)
+        # polygon of camera footprint (calculated once & cached next to the coordinate rasters)
+        footprint = aux_proj.get_footprint(coord_dir) if footprint_filter else None
         map_pj = osr.SpatialReference()
         map_pj.ImportFromEPSG(4326)
-        append = '_to_img.shp'
+        append = '_to_img'
     else:        
         map_pj = osr.SpatialReference()
         map_pj.ImportFromWkt(pj_file)
-        append = '_to_map.shp'
+        append = '_to_map'
+    
+    ##### get driver & file extension of output format
+    formats = {'shp': ('ESRI Shapefile', '.shp'), 'gpkg': ('GPKG', '.gpkg'), 'fgb': ('FlatGeobuf', '.fgb')}
+    if out_format not in formats:
+        print('Error: unknown vector format ' + str(out_format))
+        sys.exit(1)
+    driver = ogr.GetDriverByName(formats[out_format][0])
+    if driver is None:
+        print('Error: vector format ' + formats[out_format][0] + ' is not supported by this GDAL version')
+        sys.exit(1)
     
     
     ############### read shp data which should be projected ###################
-    driver = ogr.GetDriverByName("ESRI Shapefile")
     for img_file in img_file_list:
-        dataSource = driver.Open(img_file, 0)
+        dataSource = ogr.Open(img_file, 0)
         layer = dataSource.GetLayer()    
         layerDefinition = layer.GetLayerDefn()
+        # read only features, which intersect the camera footprint
+        if to_image_view and footprint is not None:
+            layer.SetSpatialFilter(footprint)
         
-        ##### create shp-file for projected result
+        ##### create vector file for projected result
         img_name = os.path.basename(img_file)               # get image name 
-        shp_name = img_name.split('.')[0]+append         # create output map name from that
+        shp_name = img_name.split('.')[0]+append+formats[out_format][1]         # create output map name from that
+        if os.path.exists(os.path.join(out_dir, shp_name)):
+            driver.DeleteDataSource(os.path.join(out_dir, shp_name))
         data_source = driver.CreateDataSource(os.path.join(out_dir, shp_name))
-        layer2 = data_source.CreateLayer("projected",map_pj, layer.GetGeomType())
+        # shp-files do not distinguish single & multi-part lines/polygons, other formats store them as multi-geometries
+        geom_type = layer.GetGeomType()
+        if out_format != 'shp' and dataSource.GetDriver().GetName() == 'ESRI Shapefile' and ogr.GT_Flatten(geom_type) in [ogr.wkbLineString, ogr.wkbPolygon]:
+            geom_type = ogr.GT_GetCollection(geom_type)
+        else:
+            geom_type = None
+        layer2 = data_source.CreateLayer("projected",map_pj, geom_type if geom_type is not None else layer.GetGeomType())
         
         ##### Add the fields to new shp file
         for i in range(layerDefinition.GetFieldCount()):
@@ -432,52 +576,31 @@ def project_geometry(coord_dir, pj_file, image_folder, out_dir, file=False, to_i
             new_field = ogr.FieldDefn(fieldName, fieldTypeCode)
             new_field.SetWidth(fieldWidth)
             layer2.CreateField(new_field)
+        # index of output field for each input field (looked up once per layer)
+        layerDefinition2 = layer2.GetLayerDefn()
+        field_map = [layerDefinition2.GetFieldIndex(layerDefinition.GetFieldDefn(i).GetName()) for i in range(layerDefinition.GetFieldCount())]
+        # write each batch in one transaction, if the format supports it (GeoPackage)
+        transactions = data_source.TestCapability(ogr.ODsCTransactions)
             
     ############### Project features ##########################################
+        ##### project features in batches (all vertices of a batch at once)
+        batch = []
         for feature in layer:
-            ##### get single features
-            feature_out = ogr.Feature(layer2.GetLayerDefn())
-            geom = feature.GetGeometryRef()
-            # if Polygon extract ring
-            if layer.GetGeomType()==3:
-                geom = geom.GetGeometryRef(0)
-                ring = ogr.Geometry(ogr.wkbLinearRing)
-            geom_out = ogr.Geometry(layer2.GetGeomType())
-            
-            ##### get position and project each point in feature
-            for i in range(geom.GetPointCount()):
-                data = geom.GetPoint(i)
-                # or to image plane
-                if to_image_view:    
-                    (easting, northing, z) = data
-                    if not any([np.isnan(easting),np.isnan(northing)]):
-                        distance = (north-northing)**2+(east-easting)**2
-                        val_1 = np.mean(np.where(distance == np.nanmin(distance))[1].tolist())
-                        val_2 = -np.mean(np.where(distance == np.nanmin(distance))[0].tolist())
-                    else:
-                        val_1 = np.nan
-                        val_2 = np.nan
-                # either to map coordinates
-                else:
-                    (col_pos, row_pos,z) = data
-                    val_1 = east[int(-(round(row_pos))),int(round(col_pos))]
-                    val_2 = north[int(-(round(row_pos))),int(round(col_pos))]
-                if not layer.GetGeomType()==3:
-                    geom_out.AddPoint(val_1, val_2)
-                # if polygon, add points to ring and add it as a Polygon to feature object
-                else:
-                    ring.AddPoint(val_1, val_2)
-            if layer.GetGeomType()==3:
-                geom_out.AddGeometry(ring)
-                
-            ##### store new position and copy variable values to new shp file
-            feature_out.SetGeometry(geom_out)
-            for i in range(layerDefinition.GetFieldCount()):
-                feature_out.SetField(layerDefinition.GetFieldDefn(i).GetName(),feature.GetField(layerDefinition.GetFieldDefn(i).GetName()))
-            # Create the feature in the layer (shapefile)
-            layer2.CreateFeature(feature_out)
-            # Dereference the feature
-            feature = None
+            batch.append(feature)
+            if len(batch) == batch_size:
+                if transactions:
+                    data_source.StartTransaction()
+                aux_proj.write_feature_batch(batch, layer2, coords, to_image_view, max_distance, field_map, geom_type)
+                if transactions:
+                    data_source.CommitTransaction()
+                batch = []
+        if batch:
+            if transactions:
+                data_source.StartTransaction()
+            aux_proj.write_feature_batch(batch, layer2, coords, to_image_view, max_distance, field_map, geom_type)
+            if transactions:
+                data_source.CommitTransaction()
+            batch = []
             
         # Save and close the data source
         data_source = None
@@ -3,7 +3,7 @@
 """
 #############################################################################################################
 Created on Fri May 08 2020
-Last edited on Wed Jun 09 2021
+Last edited on Sun Oct 18 2026
 
 Author: Sebastian Buchelt
 
@@ -140,8 +140,10 @@ def extract_params(input_dict, run_name, in_dir=False):
 # input:
 #       - input_dict: dictionary used for the georeferencing procedure.
 #       - run_name: name for projection run to recognize output file of PRACTISE.
+#       - tile_pixels: images with more pixels are interpolated in strips on a process pool
+#                      (keeps memory bounded for large/panoramic images)
 ###############################################################################
-def calc_result(input_dict, run_name):
+def calc_result(input_dict, run_name, tile_pixels=20000000):
     # import required libraries and submodules of georef_webcam
     import os, shutil
     import numpy as np
@@ -168,8 +170,8 @@ def calc_result(input_dict, run_name):
     img_col = aux_res.get_data_from_PRACTISE(result_output, 167)
     img_row = aux_res.get_data_from_PRACTISE(result_output, 168)
     points = [(int(img_row[pt]), int(img_col[pt])) for pt in range(len(img_col))]
-    # create interpolation grid 
-    interpolation_grid = np.mgrid[0:rows, 0:cols]
+    # create interpolation grid (broadcasted row & column index, no full arrays are allocated)
+    interpolation_grid = np.broadcast_arrays(*np.ogrid[0:rows, 0:cols])
     
     ############### calculate results #########################################
     ##### decide, which results should be produced
@@ -182,13 +184,34 @@ def calc_result(input_dict, run_name):
     # select interpolation style: nearest neighbor or bilinear
     print('How do you want to interpolate the coordinate rasters? Nearest neighbor or Bilinear?')
     interpolate = aux_func.select_choices(['nearest', 'linear'])[0]
-    # interpolate coordinate (E & N) rasters
-    east_raster = aux_res.interpolate_raster(aux_res.get_data_from_PRACTISE(result_output, 135), points, interpolation_grid, output_dir, "east_raster.tif", interpolation_type = interpolate)
-    north_raster = aux_res.interpolate_raster(aux_res.get_data_from_PRACTISE(result_output, 136), points, interpolation_grid, output_dir, "north_raster.tif", interpolation_type = interpolate)
-    # interpolate altitude raster (optional)
-    if (set(['+ altitude raster', 'all results']).intersection(selected_results)):
-        alt_raster = aux_res.interpolate_raster(aux_res.get_data_from_PRACTISE(result_output, 137), points, interpolation_grid, output_dir, "alt_raster.tif", interpolation_type = interpolate)
-        del alt_raster
+    # store rasters as Cloud-Optimized GeoTIFFs with overviews?
+    cog = aux_func.check_input("Do you want to store the result rasters as Cloud-Optimized GeoTIFFs (with overviews)?")
+    # camera position (needed for distance to camera)
+    pos_E = aux_res.get_data_from_PRACTISE(result_output, 5)
+    pos_N = aux_res.get_data_from_PRACTISE(result_output, 6)
+    cam_pos = (pos_E[0], pos_N[0])
+    tiled = rows*cols > tile_pixels
+    if tiled:
+        # large image: interpolate all rasters (and distance to camera) strip by strip & write them directly to tif-files
+        data_list = [aux_res.get_data_from_PRACTISE(result_output, 135), aux_res.get_data_from_PRACTISE(result_output, 136)]
+        filenames = ["east_raster.tif", "north_raster.tif"]
+        if (set(['+ altitude raster', 'all results']).intersection(selected_results)):
+            data_list.append(aux_res.get_data_from_PRACTISE(result_output, 137))
+            filenames.append("alt_raster.tif")
+        aux_res.interpolate_rasters_tiled(data_list, points, (rows, cols), output_dir, filenames, interpolation_type = interpolate, 
+                                          cam_pos = cam_pos if (set(['+ distance to camera', 'all results']).intersection(selected_results)) else None, cog = cog)
+    else:
+        # triangulation/nearest point search is done once for all rasters (& reused, if results are calculated again)
+        # (weights are cached outside of georef_result, so that the result directory only contains results)
+        weights = aux_res.get_interpolation_weights(points, interpolation_grid, os.path.join(input_dict['path'], 'georef_cache'), interpolation_type = interpolate)
+        # interpolate coordinate (E & N) rasters
+        east_raster = aux_res.interpolate_raster(aux_res.get_data_from_PRACTISE(result_output, 135), points, interpolation_grid, output_dir, "east_raster.tif", interpolation_type = interpolate, weights = weights, cog = cog)
+        north_raster = aux_res.interpolate_raster(aux_res.get_data_from_PRACTISE(result_output, 136), points, interpolation_grid, output_dir, "north_raster.tif", interpolation_type = interpolate, weights = weights, cog = cog)
+        # interpolate altitude raster (optional)
+        if (set(['+ altitude raster', 'all results']).intersection(selected_results)):
+            alt_raster = aux_res.interpolate_raster(aux_res.get_data_from_PRACTISE(result_output, 137), points, interpolation_grid, output_dir, "alt_raster.tif", interpolation_type = interpolate, weights = weights, cog = cog)
+            del alt_raster
+        del weights
     
     ##### copy image to output directory and save directory to dem for prj information
     shutil.copy2(input_dict['image_file'], output_dir)
@@ -196,19 +219,25 @@ def calc_result(input_dict, run_name):
         dem_file.write(input_dict['dem_file'])
     
     ##### generate mask to filter areas above skyline
-    # calculate distance to DEM points in image plane to get skyline
-    dist_pts_raster = aux_res.calculate_distance_raster(points, interpolation_grid, output_dir)
-    # create mask
-    aux_res.create_mask(dist_pts_raster, output_dir)
+    print('How do you want to derive the skyline for the mask? From distance raster or directly from projected DEM points?')
+    mask_mode = aux_func.select_choices(['distance raster', 'skyline from projected DEM points'])[0]
+    if mask_mode == 'distance raster':
+        # calculate distance to DEM points in image plane to get skyline
+        dist_pts_raster = aux_res.calculate_distance_raster(points, interpolation_grid, output_dir, cog = cog)
+        # create mask
+        aux_res.create_mask(dist_pts_raster, output_dir, cog = cog)
+    else:
+        # top row of DEM points in each column, small gaps are bridged
+        skyline = aux_res.calculate_skyline(img_row, img_col, rows, cols, max_gap = 50, smooth = 3)
+        # create mask & store skyline as polyline and json-file
+        aux_res.create_skyline_mask(skyline, rows, output_dir, cog = cog)
+        aux_res.export_skyline(skyline, rows, output_dir)
     
-    ##### calculate distance to camera (optional)
+    ##### calculate distance to camera (optional, already stored with tiled interpolation)
     #           edges in panoramic view can be derived from that
-    if (set(['+ distance to camera', 'all results']).intersection(selected_results)):
-        pos_E = aux_res.get_data_from_PRACTISE(result_output, 5)
-        pos_N = aux_res.get_data_from_PRACTISE(result_output, 6)
-        cam_pos = (pos_E[0], pos_N[0])
+    if (set(['+ distance to camera', 'all results']).intersection(selected_results)) and not tiled:
         dist_raster = np.sqrt((east_raster-cam_pos[0])**2+(north_raster-cam_pos[1])**2)
-        aux_res.write_array_as_geotiff(dist_raster, output_dir, "dist_raster.tif")
+        aux_res.write_array_as_geotiff(dist_raster, output_dir, "dist_raster.tif", cog = cog)
     
     ##### project image to map
     if (set(['+ projected image', 'all results']).intersection(selected_results)):
@@ -3,7 +3,7 @@
 """
 #############################################################################################################
 Created on Mon Jun 08 2020
-Last edited on Fri Feb 11 2022
+Last edited on Sun Oct 18 2026
 
 Author: Sebastian Buchelt
 
@@ -42,50 +42,91 @@ parser.add_argument(dest='file_or_folder', type=str, help='single file or extens
 parser.add_argument(dest='out_dir', type=str, help='add directory, where projected images should be stored')
 parser.add_argument("-ex","--extension", type=str, help='add directory, if several coregistered images should be projected', default = 'tif')
 parser.add_argument('-px','--pixel_size', type=float, help='spatial resolution of projected map', default = 1)
-parser.add_argument("-fill","--fill_nodata", type=int, default=0, help='add, if resulting gaps should be filled using close-range interpolation (gdal_fillnodata), value gives pixel range of gap filling')
+parser.add_argument("-fill","--fill_nodata", type=int, default=0, help='add, if resulting gaps should be filled using close-range interpolation (gdal.FillNodata), value gives pixel range of gap filling')
 parser.add_argument("-i","--to_image_view", help='add, if geotiff or shp should be projected from map coordinates into image plane', action="store_true")
 parser.add_argument("-shp","--project_shp", help='add, if a shp-file should be projected', action="store_true")
+parser.add_argument("-stack","--stack", help='add, if all images of a folder should be projected into a single multi-band tif', action="store_true")
+parser.add_argument("-w","--workers", type=int, default=1, help='number of processes used to project the files of a folder in parallel')
+parser.add_argument("-c","--compress", type=str, default='DEFLATE', choices=['DEFLATE', 'ZSTD', 'LZW', 'NONE'], help='compression of projected maps (stored as tiled GeoTIFF)')
+parser.add_argument("-cog","--cog", help='add, if projected maps should be stored as Cloud-Optimized GeoTIFF with overviews', action="store_true")
+parser.add_argument("-dt","--data_type", type=str, default=None, help='GDAL data type of output (e.g. Byte, UInt16, Float32), by default the data type of the input is kept (8-bit input without no-Data-value gets a mask band instead of a no-Data-value)')
+parser.add_argument("-trunc","--truncate", help='add, if mean values should be truncated instead of rounded, when they are stored as integers', action="store_true")
+parser.add_argument("-agg","--aggregation", type=str, default='mean', choices=['mean', 'median', 'min', 'max', 'std', 'mode'], help='aggregation of all image pixels assigned to the same map pixel')
+parser.add_argument("-count","--count_band", help='add, if an additional band with the number of image pixels assigned to each map pixel should be stored', action="store_true")
+parser.add_argument("-res","--resampling", type=str, default=None, choices=['push', 'nearest', 'idw', 'bilinear', 'cubic'], help='to map: push (default): image pixels are assigned to map pixels, nearest/idw: map pixels get value of nearest/inverse distance weighted k nearest image pixels; with -i (tif to image plane): nearest (default), bilinear or cubic sampling of the tif')
+parser.add_argument("-k","--k_nearest", type=int, default=4, help='number of nearest image pixels used with resampling idw')
+parser.add_argument("-rad","--max_radius", type=float, default=None, help='maximum distance (in map units) between map pixel and image pixel with resampling nearest or idw (default: 3 x pixel size)')
+parser.add_argument("-dist","--max_distance", type=float, default=None, help='maximum distance (in map units) between a vertex and the nearest image pixel, when shp-files are projected to image plane; vertices further away are set to NaN')
+parser.add_argument("-vf","--vector_format", type=str, default='shp', choices=['shp', 'gpkg', 'fgb'], help='format of projected vector data: shp (ESRI Shapefile), gpkg (GeoPackage) or fgb (FlatGeobuf)')
 
-# get arguments from parser
-args = parser.parse_args()
+# run script only, if it is executed directly (worker processes of multiprocessing re-import this module)
+if __name__ == '__main__':
 
-# check, if files exist
-if not os.path.isdir(args.coord_dir):
-    print("Error: Directory to Coordinate Rasters and Mask does not exist")
-    sys.exit()
-if not os.path.isfile(args.file_or_folder):
-    file_extension = args.extension
-    image_folder = args.file_or_folder
-    filename = None
-    file = False
-#    if args.image_folder == None:
-#        args.image_folder = input("'filename_or_extension' is not a file. \nHence, a directory to data, which should be projected, is required. \nPlease enter directory, where images are stored:\n")
-#    if not os.path.isdir(args.image_folder):
-#        print("Error: Image Directory or Image File does not exist")
-#        sys.exit()
-else: 
-    filename = args.file_or_folder
-    file_extension = os.path.splitext(filename)[1][1:]
-    image_folder = None
-    file = True
-        
-# get crs information...
-with open(os.path.join(args.coord_dir, 'dem_file.txt'), 'r') as output:
-    DemDs = gdal.Open(output.readlines()[0], GA_ReadOnly)
-    pj_DEM=DemDs.GetProjection()    
+    # get arguments from parser
+    args = parser.parse_args()
     
-# run projection procedure
-if args.project_shp:
-    print ("Running shp-file projection...")
+    # check, if resampling mode can be used for the selected projection direction
     if args.to_image_view:
-        print ("Projecting shp to image plane...")
-    proj_map.project_geometry(args.coord_dir, pj_DEM, args.file_or_folder, args.out_dir, file, args.to_image_view)     
-elif args.to_image_view:
-    print ("Projecting tif-file to image plane...")
-    proj_map.project_to_image_plane(args.coord_dir, args.file_or_folder, args.out_dir, file)
-else:
-    print ("Projecting data to map...")
-    if file_extension == 'tif':
-        proj_map.project_tif(args.coord_dir, float(args.pixel_size), pj_DEM, args.file_or_folder, args.out_dir, args.fill_nodata, file)
+        resampling_modes = ['nearest', 'bilinear', 'cubic']
+    else:
+        resampling_modes = ['push', 'nearest', 'idw']
+    if args.resampling is None:
+        args.resampling = resampling_modes[0]
+    elif not args.project_shp and args.resampling not in resampling_modes:
+        parser.error('resampling ' + args.resampling + (' cannot be used with -i' if args.to_image_view else ' requires -i') + 
+                     ' (choose from ' + ', '.join(resampling_modes) + ')')
+    
+    # check, if options are available for projection of a folder into a single multi-band map
+    if args.stack and not (args.project_shp or args.to_image_view or os.path.isfile(args.file_or_folder)):
+        unavailable = [option for option, used in [('-fill', args.fill_nodata), ('-count', args.count_band), ('-w', args.workers > 1)] if used]
+        if unavailable:
+            parser.error(', '.join(unavailable) + ' cannot be used with -stack')
+
+    # check, if files exist
+    if not os.path.isdir(args.coord_dir):
+        print("Error: Directory to Coordinate Rasters and Mask does not exist")
+        sys.exit()
+    if not os.path.isfile(args.file_or_folder):
+        file_extension = args.extension
+        image_folder = args.file_or_folder
+        filename = None
+        file = False
+    #    if args.image_folder == None:
+    #        args.image_folder = input("'filename_or_extension' is not a file. \nHence, a directory to data, which should be projected, is required. \nPlease enter directory, where images are stored:\n")
+    #    if not os.path.isdir(args.image_folder):
+    #        print("Error: Image Directory or Image File does not exist")
+    #        sys.exit()
+    else: 
+        filename = args.file_or_folder
+        file_extension = os.path.splitext(filename)[1][1:]
+        image_folder = None
+        file = True
+        
+    # get crs information...
+    with open(os.path.join(args.coord_dir, 'dem_file.txt'), 'r') as output:
+        DemDs = gdal.Open(output.readlines()[0], GA_ReadOnly)
+        pj_DEM=DemDs.GetProjection()    
+    
+    # run projection procedure
+    if args.project_shp:
+        print ("Running shp-file projection...")
+        if args.to_image_view:
+            print ("Projecting shp to image plane...")
+        proj_map.project_geometry(args.coord_dir, pj_DEM, args.file_or_folder, args.out_dir, file, args.to_image_view, max_distance = args.max_distance, out_format = args.vector_format)     
+    elif args.to_image_view:
+        print ("Projecting tif-file to image plane...")
+        proj_map.project_to_image_plane(args.coord_dir, args.file_or_folder, args.out_dir, file, out_dtype = args.data_type, resampling = args.resampling, stack = args.stack and not file)
     else:
-        proj_map.project_image(args.coord_dir, float(args.pixel_size), pj_DEM, image_folder, file_extension, filename, args.out_dir, args.fill_nodata, data =True)
+        print ("Projecting data to map...")
+        if file_extension == 'tif' and args.stack and not file:
+            proj_map.project_tif_stack(args.coord_dir, float(args.pixel_size), pj_DEM, args.file_or_folder, args.out_dir, compress = args.compress, cog = args.cog, 
+                                       out_dtype = args.data_type, round_values = not args.truncate, method = args.aggregation, 
+                                       resampling = args.resampling, k = args.k_nearest, max_radius = args.max_radius)
+        elif file_extension == 'tif':
+            proj_map.project_tif(args.coord_dir, float(args.pixel_size), pj_DEM, args.file_or_folder, args.out_dir, args.fill_nodata, file, workers = args.workers, compress = args.compress, cog = args.cog, 
+                                 out_dtype = args.data_type, round_values = not args.truncate, method = args.aggregation, count_band = args.count_band, 
+                                 resampling = args.resampling, k = args.k_nearest, max_radius = args.max_radius)
+        else:
+            proj_map.project_image(args.coord_dir, float(args.pixel_size), pj_DEM, image_folder, file_extension, filename, args.out_dir, args.fill_nodata, data =True, stack = args.stack and not file, workers = args.workers, compress = args.compress, cog = args.cog, 
+                                   out_dtype = args.data_type, round_values = not args.truncate, method = args.aggregation, count_band = args.count_band, 
+                                 resampling = args.resampling, k = args.k_nearest, max_radius = args.max_radius)